@@ -0,0 +1,284 @@
+"""
+Offline benchmarks.
+
+    python benchmark.py ingest [--playlists N] [--tracks N] [--row-budget N]
+    python benchmark.py matching [--threshold X] [--repeat N]
+    python benchmark.py e2e [--playlists N] [--tracks N] [--page-latency S] [--search-latency S] ...
+
+Each benchmark runs against a throwaway database in a temporary directory
+and never touches the network; e2e drives PlaylistTransferManager against the
+fakes in fake_services.py.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import resource
+import tempfile
+import time
+from contextlib import contextmanager
+
+import database
+import matching
+from metrics import REGISTRY
+from spotify import SpotifyTrack
+
+# (song name, song artists, result title, result artists, is the same recording)
+MATCHING_FIXTURES = [
+    ("Bohemian Rhapsody", ["Queen"], "Bohemian Rhapsody (Remastered 2011)", ["Queen"], True),
+    ("Bohemian Rhapsody - Remastered 2011", ["Queen"], "Bohemian Rhapsody", ["Queen"], True),
+    ("Señorita", ["Shawn Mendes", "Camila Cabello"], "Senorita", ["Shawn Mendes", "Camila Cabello"], True),
+    ("Lose Yourself", ["Eminem"], "Lose Yourself (From \"8 Mile\" Soundtrack)", ["Eminem"], True),
+    ("Hey Jude - Remastered 2015", ["The Beatles"], "Hey Jude (Remastered 2015)", ["The Beatles"], True),
+    ("I Don't Care (with Justin Bieber)", ["Ed Sheeran", "Justin Bieber"], "I Don't Care", ["Ed Sheeran", "Justin Bieber"], True),
+    ("Mi Gente (feat. Beyoncé)", ["J Balvin", "Willy William", "Beyoncé"], "Mi Gente (feat. Beyonce)", ["J Balvin"], True),
+    ("Don't Stop Me Now - Remastered", ["Queen"], "Don't Stop Me Now", ["Queen"], True),
+    ("Blinding Lights", ["The Weeknd"], "Blinding Lights", ["The Weeknd"], True),
+    ("Sweet Child O' Mine", ["Guns N' Roses"], "Sweet Child O' Mine", ["Guns N' Roses"], True),
+    ("Can't Hold Us - feat. Ray Dalton", ["Macklemore & Ryan Lewis", "Ray Dalton"], "Can't Hold Us (feat. Ray Dalton)", ["Macklemore", "Ryan Lewis"], True),
+    ("Smells Like Teen Spirit", ["Nirvana"], "Smells Like Teen Spirit (Official Music Video)", ["Nirvana"], True),
+    ("Billie Jean", ["Michael Jackson"], "Billie Jean", ["Michael Jackson"], True),
+    ("Despacito - Remix", ["Luis Fonsi", "Daddy Yankee", "Justin Bieber"], "Despacito (Remix)", ["Luis Fonsi", "Daddy Yankee"], True),
+    ("Take On Me", ["a-ha"], "Take on Me", ["a-ha"], True),
+    ("Hallelujah", ["Jeff Buckley"], "Hallelujah", ["Jeff Buckley"], True),
+    ("Stayin' Alive", ["Bee Gees"], "Stayin Alive", ["Bee Gees"], True),
+    ("Mr. Brightside", ["The Killers"], "Mr Brightside", ["The Killers"], True),
+    ("Rolling in the Deep", ["Adele"], "Rolling In The Deep", ["ADELE"], True),
+    ("Tití Me Preguntó", ["Bad Bunny"], "Titi Me Pregunto", ["Bad Bunny"], True),
+    ("Jóga", ["Björk"], "Joga", ["Bjork"], True),
+    ("Bad Guy", ["Billie Eilish"], "bad guy", ["Billie Eilish"], True),
+    ("Wonderwall - Remastered", ["Oasis"], "Wonderwall (Remastered)", ["Oasis"], True),
+    ("Sicko Mode", ["Travis Scott"], "SICKO MODE", ["Travis Scott", "Drake"], True),
+    ("Uptown Funk (feat. Bruno Mars)", ["Mark Ronson", "Bruno Mars"], "Uptown Funk ft. Bruno Mars", ["Mark Ronson"], True),
+    ("Bohemian Rhapsody", ["Queen"], "Bohemian Rhapsody (Live Aid 1985)", ["Queen"], False),
+    ("Hallelujah", ["Jeff Buckley"], "Hallelujah", ["Leonard Cohen"], False),
+    ("Hallelujah", ["Jeff Buckley"], "Hallelujah (Karaoke Version)", ["Sing King"], False),
+    ("Blinding Lights", ["The Weeknd"], "Blinding Lights (Slowed + Reverb)", ["The Weeknd"], False),
+    ("Hurt", ["Nine Inch Nails"], "Hurt", ["Johnny Cash"], False),
+    ("Yesterday", ["The Beatles"], "Yesterday Once More", ["Carpenters"], False),
+    ("Stay", ["Rihanna", "Mikky Ekko"], "Stay", ["The Kid LAROI", "Justin Bieber"], False),
+    ("Creep", ["Radiohead"], "Creep", ["TLC"], False),
+    ("Billie Jean", ["Michael Jackson"], "Billie Jean (Piano Cover)", ["Peter Bence"], False),
+    ("Mr. Brightside", ["The Killers"], "Mr. Brightside (Acoustic)", ["The Killers"], False),
+    ("Smells Like Teen Spirit", ["Nirvana"], "Smells Like Teen Spirit (Instrumental)", ["Nirvana"], False),
+    ("Lose Yourself", ["Eminem"], "Lose Control", ["Missy Elliott"], False),
+    ("Toxic", ["Britney Spears"], "Toxic", ["2WEI"], False),
+    ("Heroes", ["David Bowie"], "Heroes Tonight", ["Janji"], False),
+    ("Angel", ["Massive Attack"], "Angel", ["Shaggy"], False),
+    ("One", ["U2"], "One", ["Metallica"], False),
+    ("Wonderwall", ["Oasis"], "Wonderwall (Nightcore)", ["Nightcore"], False),
+]
+
+
+@contextmanager
+def temporary_workdir():
+    """Run inside a temporary directory so per-user database files are discarded"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            yield workdir
+        finally:
+            os.chdir(cwd)
+
+
+def synthetic_library(playlists: int, tracks: int, catalog: int, seed: int = 0, isrc_share: float = 0.7) -> dict:
+    """
+    Build {playlist_id: [SpotifyTrack]} drawn from a shared catalog.
+
+    Playlists overlap in songs, albums and artists the way real libraries do.
+    About `isrc_share` of the songs carry an ISRC.
+    """
+    rng = random.Random(seed)
+    artists = [(f"artist{i:018d}", f"Artist {i}") for i in range(max(1, catalog // 10))]
+    albums = [(f"album{i:019d}", f"Album {i}", f"20{i % 25:02d}-01-01") for i in range(max(1, catalog // 8))]
+    songs = []
+    for i in range(catalog):
+        album = rng.choice(albums)
+        song_artists = tuple(rng.sample(artists, k=min(len(artists), rng.choice((1, 1, 1, 2, 3)))))
+        isrc = f"BENCH{i:07d}" if rng.random() < isrc_share else None
+        songs.append(SpotifyTrack(f"song{i:020d}", f"Song {i}", album[0], album[1], album[2], song_artists, isrc))
+    return {f"playlist{p:016d}": rng.sample(songs, k=min(tracks, len(songs))) for p in range(playlists)}
+
+
+async def ingest_per_table(db: database.Database, library: dict) -> None:
+    """The previous path: six separate insert_* calls per playlist"""
+    async def insert_playlist(playlist_id, songs):
+        await db.insert_spotify_playlists([(playlist_id, playlist_id, "")])
+        await asyncio.gather(
+            db.insert_spotify_songs([(s.id, s.name) for s in songs]),
+            db.insert_spotify_albums([(s.album_id, s.album_name, s.album_release_date) for s in songs]),
+            db.insert_spotify_artists([artist for s in songs for artist in s.artists]),
+            db.insert_spotify_song_artist([(s.id, artist_id) for s in songs for artist_id, _ in s.artists]),
+            db.insert_spotify_song_album([(s.id, s.album_id) for s in songs]),
+            db.insert_spotify_playlist_songs([(playlist_id, s.id) for s in songs]),
+        )
+
+    await asyncio.gather(*[insert_playlist(playlist_id, songs) for playlist_id, songs in library.items()])
+
+
+async def ingest_batched(db: database.Database, library: dict, row_budget: int) -> None:
+    buffer = database.IngestBuffer(db, row_budget)
+    for playlist_id, songs in library.items():
+        buffer.add_playlist(playlist_id, playlist_id, "")
+        await buffer.add(playlist_id, songs)
+    await buffer.flush()
+
+
+def count_rows(library: dict) -> int:
+    """Rows the per-table path submits for a library"""
+    return sum(1 + len(songs) * 4 + sum(len(s.artists) * 2 for s in songs) for songs in library.values())
+
+
+def run_ingest(args) -> None:
+    library = synthetic_library(args.playlists, args.tracks, args.catalog)
+    rows = count_rows(library)
+    print(f"Ingest: {args.playlists} playlists x {args.tracks} tracks, {rows} submitted rows")
+
+    runs = [
+        ("per-table", lambda db: ingest_per_table(db, library)),
+        (f"batched (budget {args.row_budget})", lambda db: ingest_batched(db, library, args.row_budget)),
+    ]
+    for name, ingest in runs:
+        with temporary_workdir():
+            db = database.Database("benchmark")
+            start = time.perf_counter()
+            asyncio.run(ingest(db))
+            elapsed = time.perf_counter() - start
+            db.close()
+        print(f"  {name:<24} {elapsed:8.3f}s  {rows / elapsed:12.0f} rows/s")
+
+
+def run_matching(args) -> None:
+    policies = [("legacy", matching.LegacyPolicy()), ("default", matching.DEFAULT_POLICY)]
+    cases = [(matching.prepare_query(name, artists),
+              {"videoId": "x", "title": title, "artists": [{"name": a} for a in result_artists]},
+              expected)
+             for name, artists, title, result_artists, expected in MATCHING_FIXTURES]
+    print(f"Matching: {len(cases)} labelled pairs, accept above {args.threshold}")
+
+    for name, policy in policies:
+        tp = fp = fn = 0
+        for query, candidate, expected in cases:
+            accepted = policy.score(query, candidate) > args.threshold
+            tp += accepted and expected
+            fp += accepted and not expected
+            fn += expected and not accepted
+        correct = len(cases) - fp - fn
+
+        # Cold clears the normalization cache every pass; warm reuses it, as repeated artists do
+        timings = []
+        for cold in (True, False):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                if cold:
+                    matching.normalize.cache_clear()
+                for query, candidate, _ in cases:
+                    policy.score(query, candidate)
+            timings.append((time.perf_counter() - start) / (args.repeat * len(cases)) * 1e6)
+        print(f"  {name:<8} accuracy {correct / len(cases):6.1%}  "
+              f"({tp} true / {fp} false accepts, {fn} misses)  "
+              f"{timings[0]:7.2f} us/candidate cold, {timings[1]:7.2f} warm")
+
+
+async def transfer_library(spotify_options: dict, youtube_options: dict) -> None:
+    """Ingest the whole Spotify library and transfer every playlist, as a real run would"""
+    import main as app
+
+    manager = app.PlaylistTransferManager(spotify_options=spotify_options, youtube_options=youtube_options)
+    try:
+        await manager.initialize(code="benchmark")
+        await manager.process_spotify_playlists()
+        playlist_ids = [playlist[0] for playlist in manager.database.list_spotify_playlists()]
+        await manager.process_youtube_transfer(playlist_ids)
+    finally:
+        await manager.close()
+
+
+def run_e2e(args) -> None:
+    from fake_services import FakeSpotify, FakeYTMusic
+    from rate_limiter import RateGovernor
+
+    library = synthetic_library(args.playlists, args.tracks, args.catalog)
+    entries = sum(len(songs) for songs in library.values())
+    spotify = FakeSpotify(library, page_latency=args.page_latency, throttle_rate=args.throttle_rate,
+                          retry_after=args.retry_after)
+    ytmusic = FakeYTMusic(library, search_latency=args.search_latency, write_latency=args.write_latency,
+                          error_rate=args.error_rate, unavailable_rate=args.unavailable_rate)
+    # Generous limits so the fakes' latency, not the governor's warm-up, sets the pace; the rate
+    # floor keeps injected errors from throttling the run down to the production minimum. The
+    # additive step scales with the rate like the default (0.1 at 2/s), so after a cut the rate
+    # climbs back in about twenty successful calls at any --yt-rate
+    governor = RateGovernor(rate=args.yt_rate, burst=args.yt_rate, concurrency=args.yt_concurrency,
+                            min_rate=args.yt_rate / 10, max_rate=args.yt_rate * 2, max_concurrency=args.yt_concurrency * 2,
+                            rate_step=args.yt_rate / 20, base_backoff=0.01, max_backoff=0.1)
+    print(f"End to end: {args.playlists} playlists x {args.tracks} tracks ({entries} entries), "
+          f"{args.page_latency * 1000:.0f} ms/page, {args.search_latency * 1000:.0f} ms/search, "
+          f"{args.throttle_rate:.0%} throttled, {args.error_rate:.0%} YouTube errors, "
+          f"{len(ytmusic.unavailable)} unavailable videos")
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    with temporary_workdir():
+        start = time.perf_counter()
+        asyncio.run(transfer_library({"transport": spotify.transport},
+                                     {"ytmusic": ytmusic, "governor": governor, "retry_delay": 0.01}))
+        elapsed = time.perf_counter() - start
+    logging.disable(logging.NOTSET)
+
+    spotify_calls = sum(count for name, count in spotify.calls.items() if name != "throttled")
+    youtube_calls = sum(ytmusic.calls.values())
+    transferred = sum(len(items) for items in ytmusic.playlists.values())
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"  {elapsed:8.3f}s  {entries / elapsed:10.1f} tracks/s  {transferred}/{entries} tracks transferred")
+    print(f"  Spotify  {spotify_calls:6d} calls  {spotify_calls / entries:6.3f}/track  "
+          f"({spotify.calls['throttled']} throttled)")
+    print(f"  YouTube  {youtube_calls:6d} calls  {youtube_calls / entries:6.3f}/track  {dict(ytmusic.calls)}")
+    print(f"  peak RSS {peak_rss:8.1f} MB")
+    if args.metrics:
+        for path in REGISTRY.export(args.metrics):
+            print(f"  metrics written to {path}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="compare per-table and batched Spotify ingest")
+    ingest.add_argument("--playlists", type=int, default=100)
+    ingest.add_argument("--tracks", type=int, default=200)
+    ingest.add_argument("--catalog", type=int, default=10000)
+    ingest.add_argument("--row-budget", type=int, default=5000)
+    ingest.set_defaults(run=run_ingest)
+
+    scoring = commands.add_parser("matching", help="accuracy and cost of the search result scoring policies")
+    scoring.add_argument("--threshold", type=float, default=0.6)
+    scoring.add_argument("--repeat", type=int, default=2000)
+    scoring.set_defaults(run=run_matching)
+
+    e2e = commands.add_parser("e2e", help="full ingest and transfer against fake Spotify and YouTube Music")
+    e2e.add_argument("--playlists", type=int, default=20)
+    e2e.add_argument("--tracks", type=int, default=100)
+    e2e.add_argument("--catalog", type=int, default=1000)
+    e2e.add_argument("--page-latency", type=float, default=0.05, help="seconds per Spotify page")
+    e2e.add_argument("--throttle-rate", type=float, default=0.05, help="share of Spotify calls answered with 429")
+    e2e.add_argument("--retry-after", type=float, default=0.1)
+    e2e.add_argument("--search-latency", type=float, default=0.02, help="seconds per YouTube Music search")
+    e2e.add_argument("--write-latency", type=float, default=0.05, help="seconds per YouTube Music playlist edit")
+    e2e.add_argument("--error-rate", type=float, default=0.01, help="share of YouTube Music calls that fail")
+    e2e.add_argument("--unavailable-rate", type=float, default=0.01,
+                     help="share of songs whose video YouTube Music refuses to add")
+    e2e.add_argument("--yt-rate", type=float, default=200.0)
+    e2e.add_argument("--yt-concurrency", type=int, default=8)
+    e2e.add_argument("--verbose", action="store_true", help="keep the application's log output")
+    e2e.add_argument("--metrics", metavar="PREFIX", help="write PREFIX.prom and PREFIX.json after the run")
+    e2e.set_defaults(run=run_e2e)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,151 +1,214 @@
-import os
+import asyncio
+import functools
+import itertools
+import json
+import queue
 import sqlite3
 import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from operator import itemgetter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import migrations
+from metrics import DB_SECONDS, instrument_methods
 
 
 class SQLiteConnectionPool:
-    def __init__(self, db_name):
+    """
+    Long-lived SQLite connections for one database file.
+
+    Reads borrow one of up to `max_readers` persistent connections. All writes
+    are submitted as callables to a single writer thread, which runs whatever
+    is queued (up to `max_batch` jobs) in one transaction. Each job gets its
+    own savepoint, so a failing job does not undo the others.
+    """
+
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA cache_size=10000",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA busy_timeout=5000",
+    )
+
+    def __init__(self, db_name, max_readers: int = 4, max_batch: int = 256):
         self.db_name = db_name
+        self.max_readers = max_readers
+        self.max_batch = max_batch
         self.lock = threading.Lock()
+        self.readers = queue.LifoQueue()
+        self.reader_count = 0
+        self.writes = queue.Queue()
+        self.writer = threading.Thread(target=self._writer_loop, name=f"sqlite-writer-{db_name}", daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        # Autocommit mode; the writer thread manages transactions explicitly
+        connection = sqlite3.connect(self.db_name, check_same_thread=False, isolation_level=None)
+        for pragma in self.PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    @contextmanager
+    def reader(self):
+        try:
+            connection = self.readers.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                create = self.reader_count < self.max_readers
+                if create:
+                    self.reader_count += 1
+            connection = self._connect() if create else self.readers.get()
+        try:
+            yield connection
+        finally:
+            self.readers.put(connection)
+
+    def submit(self, job) -> Future:
+        """Queue `job(connection)` for the writer thread and return a future for its result"""
+        future = Future()
+        self.writes.put((job, future))
+        return future
+
+    def write(self, job):
+        """Run `job(connection)` on the writer thread and wait until it is committed"""
+        return self.submit(job).result()
+
+    def _writer_loop(self):
+        connection = self._connect()
+        running = True
+        while running:
+            item = self.writes.get()
+            if item is None:
+                break
+            jobs = [item]
+            while len(jobs) < self.max_batch:
+                try:
+                    item = self.writes.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                jobs.append(item)
+            self._run_batch(connection, jobs)
+        connection.close()
 
-    def __enter__(self):
-        self.lock.acquire()
-        self.connection = sqlite3.connect(self.db_name)
-        return self.connection
+    @staticmethod
+    def _run_batch(connection, jobs):
+        # Drop jobs whose caller was cancelled; the rest can no longer be cancelled,
+        # so setting their results below cannot fail and kill the writer thread
+        jobs = [(job, future) for job, future in jobs if future.set_running_or_notify_cancel()]
+        if not jobs:
+            return
+        results = []
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for job, future in jobs:
+                connection.execute("SAVEPOINT job")
+                try:
+                    results.append((future, job(connection), None))
+                    connection.execute("RELEASE job")
+                except BaseException as e:
+                    connection.execute("ROLLBACK TO job")
+                    connection.execute("RELEASE job")
+                    results.append((future, None, e))
+            connection.execute("COMMIT")
+        except sqlite3.Error as e:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            for job, future in jobs:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
 
-    def __exit__(self, type, value, traceback):
-        self.connection.close()
-        self.lock.release()
+    def close(self):
+        self.writes.put(None)
+        self.writer.join()
+        while not self.readers.empty():
+            self.readers.get_nowait().close()
 
 
+@instrument_methods(DB_SECONDS, exclude=("close",))
 class Database:
-    def __init__(self, user_id: str) -> None:
-        self.db_id = user_id
-        db_file = f"{self.db_id}.db"
-
-        if os.path.exists(db_file):
-            with sqlite3.connect(db_file) as conn:
-                if not self.is_table_present(conn, 'status'):
-                    self.initialize_database(conn)
-                else:
-                    print(f"Table 'status' already exists in database '{db_file}'. Skipping initialization.")
-        else:
-            with sqlite3.connect(db_file) as conn:
-                self.initialize_database(conn)
+    """
+    Per-user SQLite store.
 
-    @staticmethod
-    def is_table_present(conn, table_name: str) -> bool:
-        c = conn.cursor()
-        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table_name,))
-        return bool(c.fetchone())
-
-    def configure_database(self):
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            c = conn.cursor()
-            c.execute("PRAGMA journal_mode=WAL")
-            c.execute("PRAGMA cache_size=10000")
+    `async def` methods never touch SQLite on the event loop: reads run on a
+    dedicated executor and writes are awaited on the pool's writer thread.
+    Plain `def` methods block and are meant for startup or for code that is
+    already running off the loop. Every public method is timed in
+    metrics.DB_SECONDS.
+    """
 
-    def initialize_database(self, conn):
-        self.configure_database()
-        try:
-            if conn:
-                c = conn.cursor()
-            else:
-                with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-                    c = conn.cursor()
-
-            c.execute("CREATE TABLE status "
-                      "(id INTEGER PRIMARY KEY, status INTEGER NOT NULL);")
-            c.execute("INSERT INTO status (id, status) VALUES (1, 1);")
-            # create tables for spotify data
-            c.execute("CREATE TABLE spotify_playlists"
-                      "(id INTEGER PRIMARY KEY AUTOINCREMENT, sp_playlist_id TEXT NOT NULL UNIQUE, "
-                      "playlist_name TEXT NOT NULL, playlist_description TEXT);")
-            c.execute("CREATE TABLE spotify_albums"
-                      "(id INTEGER PRIMARY KEY AUTOINCREMENT, sp_album_id TEXT NOT NULL UNIQUE, album_name TEXT NOT NULL, album_date TEXT NOT NULL);")
-            c.execute("CREATE TABLE spotify_artists"
-                      "(id INTEGER PRIMARY KEY AUTOINCREMENT, sp_artist_id TEXT NOT NULL UNIQUE, artist_name TEXT NOT NULL);")
-            c.execute("CREATE TABLE spotify_songs"
-                      "(id INTEGER PRIMARY KEY AUTOINCREMENT, sp_song_id TEXT NOT NULL UNIQUE, song_name TEXT NOT NULL);")
-            c.execute("CREATE TABLE spotify_song_album"
-                      "(song_id TEXT NOT NULL, album_id TEXT NOT NULL,"
-                      "PRIMARY KEY (song_id, album_id),"
-                      "FOREIGN KEY (song_id) REFERENCES spotify_songs(id),"
-                      "FOREIGN KEY (album_id) REFERENCES spotify_albums(id));")
-            c.execute("CREATE TABLE spotify_song_artist"
-                      "(song_id TEXT NOT NULL, artist_id TEXT NOT NULL,"
-                      "PRIMARY KEY (song_id, artist_id),"
-                      "FOREIGN KEY (song_id) REFERENCES spotify_songs(id),"
-                      "FOREIGN KEY (artist_id) REFERENCES spotify_artists(id));")
-            c.execute("CREATE TABLE spotify_playlist_songs"
-                      "(id INTEGER PRIMARY KEY AUTOINCREMENT, playlist_id TEXT NOT NULL, song_id TEXT NOT NULL, sequence INTEGER,"
-                      "FOREIGN KEY (playlist_id) REFERENCES spotify_playlists(id),"
-                      "FOREIGN KEY (song_id) REFERENCES spotify_songs(id)"
-                      "UNIQUE(playlist_id, song_id, sequence));")
-            
-            # create tables for youtube
-            c.execute("CREATE TABLE youtube_playlists"
-                      "(id INTEGER PRIMARY KEY AUTOINCREMENT, yt_playlist_id TEXT NOT NULL,"
-                      "playlist_name TEXT NOT NULL, playlist_description TEXT);")
-            c.execute("CREATE TABLE youtube_songs"
-                      "(id INTEGER PRIMARY KEY AUTOINCREMENT, yt_song_id TEXT NOT NULL, song_name TEXT NOT NULL);")
-            c.execute("CREATE TABLE youtube_playlist_songs"
-                      "(playlist_id INTEGER NOT NULL, song_id INTEGER NOT NULL,"
-                      "PRIMARY KEY (playlist_id, song_id),"
-                      "FOREIGN KEY (playlist_id) REFERENCES youtube_playlists(id),"
-                      "FOREIGN KEY (song_id) REFERENCES youtube_songs(id));")
-            c.execute("CREATE TABLE youtube_spotify_playlists"
-                      "(spotify_id INTEGER NOT NULL, youtube_id INTEGER NOT NULL, done INTEGER NOT NULL,"
-                      "PRIMARY KEY (spotify_id, youtube_id),"
-                      "FOREIGN KEY (spotify_id) REFERENCES spotify_playlists(id),"
-                      "FOREIGN KEY (youtube_id) REFERENCES youtube_playlists(id));")
-            c.execute("CREATE TABLE youtube_spotify_songs"
-                      "(spotify_id INTEGER NOT NULL, youtube_id INTEGER NOT NULL,"
-                      "PRIMARY KEY (spotify_id, youtube_id),"
-                      "FOREIGN KEY (spotify_id) REFERENCES spotify_songs(id),"
-                      "FOREIGN KEY (youtube_id) REFERENCES youtube_songs(id));")
-            conn.commit()
-            print("Initialised.")
-        except sqlite3.Error as e:
-            print(f"Error initializing database: {e}")
-
-    def batch_insert_with_ignore(self, conn, table, columns, data_list):
+    def __init__(self, user_id: str) -> None:
+        self.db_id = user_id
+        self.pool = SQLiteConnectionPool(f"{self.db_id}.db")
+        self.executor = ThreadPoolExecutor(max_workers=self.pool.max_readers, thread_name_prefix="db-read")
+        self.setup_database()
+
+    async def _read(self, func, *args):
+        """Run a blocking read on the database executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def _write(self, job):
+        """Queue a write job and wait for its commit without blocking the loop"""
+        return await asyncio.wrap_future(self.pool.submit(job))
+
+    def setup_database(self) -> None:
+        # Fast path: an up-to-date schema needs nothing from the writer
+        with self.pool.reader() as conn:
+            if migrations.is_current(conn):
+                return
+        self.pool.write(migrations.migrate)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
+    def batch_insert_with_ignore(self, conn, table, columns, data_list, raise_errors: bool = False):
         placeholders = ', '.join('?' * len(columns))
         columns = ', '.join(columns)
         try:
             c = conn.cursor()
             c.executemany(f"INSERT OR IGNORE INTO {table} ({columns}) VALUES ({placeholders})", data_list)
-            conn.commit()
         except sqlite3.Error as e:
+            if raise_errors:
+                raise
             print(f"Error batch inserting into {table}: {e}")
 
+    async def insert_with_ignore(self, table, columns, data_list):
+        await self._write(lambda conn: self.batch_insert_with_ignore(conn, table, columns, data_list))
+
     async def insert_spotify_playlists(self, playlists: list) -> None:
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            columns = ['sp_playlist_id', 'playlist_name', 'playlist_description']
-            self.batch_insert_with_ignore(conn, "spotify_playlists", columns, playlists)
+        columns = ['sp_playlist_id', 'playlist_name', 'playlist_description']
+        await self.insert_with_ignore("spotify_playlists", columns, playlists)
 
     async def insert_spotify_songs(self, songs: list) -> None:
         data = [(s[0], s[1]) for s in songs]
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            self.batch_insert_with_ignore(conn, "spotify_songs", ['sp_song_id', 'song_name'], data)
+        await self.insert_with_ignore("spotify_songs", ['sp_song_id', 'song_name'], data)
 
     async def insert_spotify_albums(self, albums: list) -> None:
         data = [(a[0], a[1], a[2]) for a in albums]
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            self.batch_insert_with_ignore(conn, "spotify_albums", ['sp_album_id', 'album_name', 'album_date'], data)
+        await self.insert_with_ignore("spotify_albums", ['sp_album_id', 'album_name', 'album_date'], data)
 
     async def insert_spotify_artists(self, artists: list) -> list:
         data = [(a[0], a[1]) for a in artists]
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            self.batch_insert_with_ignore(conn, "spotify_artists", ['sp_artist_id', 'artist_name'], data)
+        await self.insert_with_ignore("spotify_artists", ['sp_artist_id', 'artist_name'], data)
 
     async def insert_spotify_song_artist(self, song_artist_data: list) -> None:
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            self.batch_insert_with_ignore(conn, "spotify_song_artist", ['song_id', 'artist_id'], song_artist_data)
+        await self.insert_with_ignore("spotify_song_artist", ['song_id', 'artist_id'], song_artist_data)
 
     async def insert_spotify_song_album(self, song_album_data: list) -> None:
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            self.batch_insert_with_ignore(conn, "spotify_song_album", ['song_id', 'album_id'], song_album_data)
+        await self.insert_with_ignore("spotify_song_album", ['song_id', 'album_id'], song_album_data)
 
     
     async def insert_spotify_playlist_songs(self, playlist_songs: list) -> None:
@@ -153,34 +216,136 @@ class Database:
         Insert playlist songs with sequence numbers.
         playlist_songs should be a list of tuples: (playlist_id, song_id)
         """
+        # Group by playlist_id and assign sequence
+        playlist_data = {}
+        for playlist_id, song_id in playlist_songs:
+            if playlist_id not in playlist_data:
+                playlist_data[playlist_id] = []
+            playlist_data[playlist_id].append(song_id)
+
+        # Prepare data for insertion with sequence numbers
+        insertion_data = []
+        for playlist_id, songs in playlist_data.items():
+            for i, song_id in enumerate(songs):
+                insertion_data.append((playlist_id, song_id, i))
+
         try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-                c = conn.cursor()
-                
-                # Group by playlist_id and assign sequence
-                playlist_data = {}
-                for playlist_id, song_id in playlist_songs:
-                    if playlist_id not in playlist_data:
-                        playlist_data[playlist_id] = []
-                    playlist_data[playlist_id].append(song_id)
-                
-                # Prepare data for insertion with sequence numbers
-                insertion_data = []
-                for playlist_id, songs in playlist_data.items():
-                    for i, song_id in enumerate(songs):
-                        insertion_data.append((playlist_id, song_id, i))
-                
-                c.executemany(
-                    "INSERT OR IGNORE INTO spotify_playlist_songs (playlist_id, song_id, sequence) VALUES (?, ?, ?)",
-                    insertion_data
-                )
-                conn.commit()
+            await self._write(lambda conn: conn.executemany(
+                "INSERT OR IGNORE INTO spotify_playlist_songs (playlist_id, song_id, sequence) VALUES (?, ?, ?)",
+                insertion_data
+            ))
         except sqlite3.Error as e:
             print(f"Error inserting playlist songs: {e}")
 
+    # (table, columns, IngestBuffer key) in insert order
+    SPOTIFY_BATCH_TABLES = [
+        ("spotify_playlists", ['sp_playlist_id', 'playlist_name', 'playlist_description'], "playlists"),
+        ("spotify_songs", ['sp_song_id', 'song_name', 'isrc'], "songs"),
+        ("spotify_albums", ['sp_album_id', 'album_name', 'album_date'], "albums"),
+        ("spotify_artists", ['sp_artist_id', 'artist_name'], "artists"),
+        ("spotify_song_artist", ['song_id', 'artist_id'], "song_artists"),
+        ("spotify_song_album", ['song_id', 'album_id'], "song_albums"),
+        ("spotify_playlist_songs", ['playlist_id', 'song_id', 'sequence'], "playlist_songs"),
+    ]
+
+    def _insert_spotify_rows(self, conn, batch: dict, raise_errors: bool = False) -> None:
+        for table, columns, key in self.SPOTIFY_BATCH_TABLES:
+            if batch[key]:
+                self.batch_insert_with_ignore(conn, table, columns, batch[key], raise_errors)
+        # Songs stored before ISRCs were fetched get theirs filled in
+        isrcs = [(isrc, song_id) for song_id, _, isrc in batch["songs"] if isrc]
+        if isrcs:
+            conn.executemany("UPDATE spotify_songs SET isrc = ? WHERE sp_song_id = ? AND isrc IS NULL", isrcs)
+        # Written with or after the playlist's last tracks, so a stored snapshot means complete tracks
+        if batch.get("snapshots"):
+            conn.executemany("UPDATE spotify_playlists SET snapshot_id = ? WHERE sp_playlist_id = ?",
+                             batch["snapshots"])
+
+    async def insert_spotify_batch(self, batch: dict) -> None:
+        """Write one IngestBuffer flush (all Spotify tables) in a single transaction"""
+        await self._write(lambda conn: self._insert_spotify_rows(conn, batch))
+
+    async def replace_spotify_playlist(self, playlist_id: str, name: str, description: str,
+                                       snapshot_id: str, batch: dict) -> None:
+        """
+        Replace a playlist's tracks with an IngestBuffer batch and store its snapshot_id.
+
+        Removing the old spotify_playlist_songs rows, inserting the new rows
+        and storing the snapshot happen in one transaction, so an interrupted
+        sync is simply redone. A failed insert raises and rolls all of it back
+        rather than leaving the playlist empty under its new snapshot.
+        """
+        def write(conn):
+            conn.execute("DELETE FROM spotify_playlist_songs WHERE playlist_id = ?", (playlist_id,))
+            self._insert_spotify_rows(conn, batch, raise_errors=True)
+            conn.execute("INSERT OR IGNORE INTO spotify_playlists (sp_playlist_id, playlist_name, playlist_description) "
+                         "VALUES (?, ?, ?)", (playlist_id, name, description))
+            conn.execute("UPDATE spotify_playlists SET playlist_name = ?, playlist_description = ?, snapshot_id = ? "
+                         "WHERE sp_playlist_id = ?", (name, description, snapshot_id, playlist_id))
+
+        await self._write(write)
+
+    async def get_playlist_sizes(self) -> Dict[str, int]:
+        """{sp_playlist_id: number of entries} for every stored playlist"""
+        def read():
+            with self.pool.reader() as conn:
+                return dict(conn.execute("SELECT playlist_id, COUNT(*) FROM spotify_playlist_songs GROUP BY playlist_id"))
+
+        try:
+            return await self._read(read)
+        except sqlite3.Error as e:
+            print(f"Error getting playlist sizes: {e}")
+            return {}
+
+    async def get_playlist_snapshots(self) -> Dict[str, Optional[str]]:
+        """{sp_playlist_id: snapshot_id} for every stored playlist; None if never synced"""
+        def read():
+            with self.pool.reader() as conn:
+                return dict(conn.execute("SELECT sp_playlist_id, snapshot_id FROM spotify_playlists").fetchall())
+
+        try:
+            return await self._read(read)
+        except sqlite3.Error as e:
+            print(f"Error getting playlist snapshots: {e}")
+            return {}
+
+    async def get_playlist_song_ids(self, playlist_id: str) -> List[str]:
+        """Spotify song IDs of a stored playlist, in order"""
+        def read():
+            with self.pool.reader() as conn:
+                return [song_id for song_id, in conn.execute(
+                    "SELECT song_id FROM spotify_playlist_songs WHERE playlist_id = ? ORDER BY sequence, id",
+                    (playlist_id,))]
+
+        try:
+            return await self._read(read)
+        except sqlite3.Error as e:
+            print(f"Error getting playlist song ids: {e}")
+            return []
+
+    async def get_youtube_ids(self, sp_song_ids) -> Dict[str, str]:
+        """{sp_song_id: youtube_id} for the given songs that already have a match"""
+        ids = list(dict.fromkeys(sp_song_ids))
+
+        def read():
+            matches = {}
+            with self.pool.reader() as conn:
+                rows = conn.execute(
+                    "SELECT j.value, MIN(yss.youtube_id) FROM json_each(?) j "
+                    "JOIN youtube_spotify_songs yss ON yss.spotify_id = j.value GROUP BY j.value",
+                    (json.dumps(ids),))
+                matches.update(rows)
+            return matches
+
+        try:
+            return await self._read(read)
+        except sqlite3.Error as e:
+            print(f"Error getting YouTube ids: {e}")
+            return {}
+
     def get_existing_song_id(self, song: tuple) -> int:
         try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
+            with self.pool.reader() as conn:
                 c = conn.cursor()
                 c.execute("SELECT id FROM spotify_songs WHERE sp_song_id=? AND song_name=?", (song[0], song[1]))
                 result = c.fetchone()
@@ -191,7 +356,7 @@ class Database:
 
     def get_existing_album_id(self, album: tuple) -> int:
         try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
+            with self.pool.reader() as conn:
                 c = conn.cursor()
                 c.execute("SELECT id FROM spotify_albums WHERE sp_album_id=? AND album_name=?", (album[0], album[1]))
                 result = c.fetchone()
@@ -202,7 +367,7 @@ class Database:
 
     def get_existing_artist_id(self, artist: tuple) -> int:
         try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
+            with self.pool.reader() as conn:
                 c = conn.cursor()
                 c.execute("SELECT id FROM spotify_artists WHERE sp_artist_id=? AND artist_name=?",
                           (artist[0], artist[1]))
@@ -214,16 +379,13 @@ class Database:
 
     def spotify_complete(self) -> None:
         try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-                c = conn.cursor()
-                c.execute("UPDATE status SET status = 2 WHERE id = 1;")
-                conn.commit()
+            self.pool.write(lambda conn: conn.execute("UPDATE status SET status = 2 WHERE id = 1;"))
         except sqlite3.Error as e:
             print(f"Error updating Spotify status: {e}")
 
     def get_status(self) -> int:
         try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
+            with self.pool.reader() as conn:
                 c = conn.cursor()
                 c.execute("SELECT status FROM status WHERE id = 1;")
                 status = c.fetchone()
@@ -234,7 +396,7 @@ class Database:
 
     def list_spotify_songs(self) -> list:
         try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
+            with self.pool.reader() as conn:
                 c = conn.cursor()
                 c.execute("SELECT id, song_name, sp_song_id FROM spotify_songs;")
                 songs = c.fetchall()
@@ -245,7 +407,7 @@ class Database:
         
     def list_spotify_playlists(self) -> list:
         try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
+            with self.pool.reader() as conn:
                 c = conn.cursor()
                 c.execute("SELECT sp_playlist_id, playlist_name, playlist_description FROM spotify_playlists")
                 playlists = c.fetchall()
@@ -254,64 +416,135 @@ class Database:
             print(f"Error getting spotify playlists: {e}")
             return []
 
-    def get_spotify_song_artist(self, song_id: int) -> list:
-        try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-                c = conn.cursor()
-                artist_ids = c.execute("SELECT artist_id FROM spotify_song_artist WHERE song_id = ?",
-                                       (song_id,)).fetchall()
-                artists = [self.get_artist_name(artist_id[0]) for artist_id in artist_ids]
-                return artists
-        except sqlite3.Error as e:
-            print(f"Error getting song artists: {e}")
-            return []
+    def get_spotify_song_artist(self, song_id: str) -> list:
+        for _, artists in self.iter_song_artists([song_id]):
+            return artists
+        return []
 
-    def get_artist_name(self, artist_id: int) -> str:
+    def iter_song_artists(self, song_ids) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Yield (song_id, [artist names]) for many songs from a single query.
+
+        Songs come out in input order and artists in Spotify's order. Songs
+        with no stored artists are skipped. The reader connection is held
+        until the iterator is exhausted.
+        """
+        ids = json.dumps(list(dict.fromkeys(song_ids)))
         try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-                c = conn.cursor()
-                c.execute("SELECT artist_name FROM spotify_artists WHERE id = ?", (artist_id,))
-                result = c.fetchone()
-                return result[0] if result else ""
+            with self.pool.reader() as conn:
+                rows = conn.execute("""
+                    SELECT ids.value, a.artist_name
+                    FROM json_each(?) ids
+                    JOIN spotify_song_artist sa ON sa.song_id = ids.value
+                    JOIN spotify_artists a ON a.sp_artist_id = sa.artist_id
+                    ORDER BY ids.key, sa.rowid
+                """, (ids,))
+                for song_id, group in itertools.groupby(rows, key=itemgetter(0)):
+                    yield song_id, [artist_name for _, artist_name in group]
         except sqlite3.Error as e:
-            print(f"Error getting artist name: {e}")
-            return ""
-        
+            print(f"Error getting song artists: {e}")
 
     async def insert_youtube_songs(self, songs: list) -> None:
         data = [(s[0], s[1]) for s in songs]
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            self.batch_insert_with_ignore(conn, "youtube_songs", ['yt_song_id', 'song_name'], data)
+        await self.insert_with_ignore("youtube_songs", ['yt_song_id', 'song_name'], data)
 
     async def insert_youtube_playlists(self, playlist_info: list) -> None:
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            self.batch_insert_with_ignore(conn, "youtube_playlists", ["yt_playlist_id", "playlist_name", "playlist_description"], playlist_info)
+        await self.insert_with_ignore("youtube_playlists", ["yt_playlist_id", "playlist_name", "playlist_description"], playlist_info)
 
     async def insert_youtube_playlist_songs(self, playlist_id: str, songs: list) -> None: 
         data = [(playlist_id, song[0]) for song in songs]
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            self.batch_insert_with_ignore(conn, "youtube_playlist_songs", ["playlist_id", "song_id"], data)
+        await self.insert_with_ignore("youtube_playlist_songs", ["playlist_id", "song_id"], data)
         
     async def insert_youtube_spotify_playlists(self, data: list) -> None:
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            self.batch_insert_with_ignore(conn, "youtube_spotify_playlists", ["spotify_id", "youtube_id", "done"], data)
+        await self.insert_with_ignore("youtube_spotify_playlists", ["spotify_id", "youtube_id", "done"], data)
 
     async def update_youtube_spotify_playlist(self, yt_id: str, update: int) -> None:
         try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-                c = conn.cursor()
-                c.execute("UPDATE done=? WHERE yt_id=?", (update, yt_id))
-                conn.commit()
+            await self._write(lambda conn: conn.execute(
+                "UPDATE youtube_spotify_playlists SET done = ? WHERE youtube_id = ?", (update, yt_id)))
 
-        except sqlite3.error as e:
+        except sqlite3.Error as e:
             print(f"Error updating youtube_spotify_playlist {e}")
 
+    async def get_transfer_checkpoint(self, sp_playlist_id: str) -> Optional[Tuple[str, int, int]]:
+        """(yt_playlist_id, added_offset, done) for a playlist that has been started, else None"""
+        def read():
+            with self.pool.reader() as conn:
+                return conn.execute(
+                    "SELECT youtube_id, added_offset, done FROM youtube_spotify_playlists WHERE spotify_id = ?",
+                    (sp_playlist_id,)
+                ).fetchone()
+
+        try:
+            return await self._read(read)
+        except sqlite3.Error as e:
+            print(f"Error getting transfer checkpoint: {e}")
+            return None
+
+    async def get_transfer_checkpoints(self) -> Dict[str, Tuple[str, int, int]]:
+        """{sp_playlist_id: (yt_playlist_id, added_offset, done)} for every started transfer"""
+        def read():
+            with self.pool.reader() as conn:
+                rows = conn.execute("SELECT spotify_id, youtube_id, added_offset, done FROM youtube_spotify_playlists")
+                return {spotify_id: tuple(checkpoint) for spotify_id, *checkpoint in rows}
+
+        try:
+            return await self._read(read)
+        except sqlite3.Error as e:
+            print(f"Error getting transfer checkpoints: {e}")
+            return {}
+
+    async def record_youtube_playlist(self, sp_playlist_id: str, yt_playlist_id: str,
+                                      name: str, description: str) -> None:
+        """Store a newly created YouTube playlist and its Spotify mapping in one transaction"""
+        def write(conn):
+            conn.execute("INSERT OR IGNORE INTO youtube_playlists (yt_playlist_id, playlist_name, playlist_description) "
+                         "VALUES (?, ?, ?)", (yt_playlist_id, name, description))
+            conn.execute("INSERT OR REPLACE INTO youtube_spotify_playlists (spotify_id, youtube_id, done, added_offset) "
+                         "VALUES (?, ?, 0, 0)", (sp_playlist_id, yt_playlist_id))
+
+        await self._write(write)
+
+    async def record_added_songs(self, yt_playlist_id: str, video_ids: List[str], offset: int,
+                                 refused: Sequence[str] = ()) -> None:
+        """
+        Record songs added to a YouTube playlist and advance its checkpoint in one transaction.
+
+        `refused` are videos YouTube Music would not add; the checkpoint may
+        move past them, so they are stored as refused in the same transaction.
+        """
+        def write(conn):
+            self.batch_insert_with_ignore(conn, "youtube_playlist_songs", ["playlist_id", "song_id"],
+                                          [(yt_playlist_id, video_id) for video_id in video_ids])
+            self.batch_insert_with_ignore(conn, "youtube_refused_songs", ["yt_song_id"],
+                                          [(video_id,) for video_id in refused])
+            conn.execute("UPDATE youtube_spotify_playlists SET added_offset = MAX(added_offset, ?) "
+                         "WHERE youtube_id = ?", (offset, yt_playlist_id))
+
+        await self._write(write)
+
+    async def record_refused_songs(self, video_ids: Sequence[str]) -> None:
+        """Store videos YouTube Music refused to add to a playlist"""
+        await self._write(lambda conn: self.batch_insert_with_ignore(
+            conn, "youtube_refused_songs", ["yt_song_id"], [(video_id,) for video_id in video_ids]))
+
+    async def get_refused_songs(self) -> set:
+        """Video IDs YouTube Music has refused to add"""
+        def read():
+            with self.pool.reader() as conn:
+                return {video_id for video_id, in conn.execute("SELECT yt_song_id FROM youtube_refused_songs")}
+
+        try:
+            return await self._read(read)
+        except sqlite3.Error as e:
+            print(f"Error getting refused songs: {e}")
+            return set()
+
     async def insert_youtube_spotify_songs(self, data: list):
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-            self.batch_insert_with_ignore(conn, "youtube_spotify_songs", ["spotify_id", "youtube_id"], data)
+        await self.insert_with_ignore("youtube_spotify_songs", ["spotify_id", "youtube_id"], data)
 
     async def update_youtube_songs(self):
-        with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
+        def update(conn):
             c = conn.cursor()
             c.execute("SELECT youtube_playlist_id, spotify_playlist_id FROM youtube_spotify_playlists")
             playlists = {spotify_id: youtube_id for spotify_id, youtube_id in c.fetchall()}
@@ -327,10 +560,14 @@ class Database:
             for song_id, playlist_ids in playlist_songs.items():
                 self.batch_insert_with_ignore(conn, "youtube_playlist_songs", ["playlist_id, song_id"], playlist_songs)
 
+        await self._write(update)
 
     async def get_playlist_songs(self, playlist_id: str) -> list:
+        return await self._read(self._get_playlist_songs, playlist_id)
+
+    def _get_playlist_songs(self, playlist_id: str) -> list:
         try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
+            with self.pool.reader() as conn:
                 c = conn.cursor()
                 
                 query = """
@@ -358,35 +595,135 @@ class Database:
         except sqlite3.Error as e:
             print(f"Error getting playlist songs: {e}")
             return []
-                
+
+    async def get_playlist_tracks(self, playlist_id: str) -> list:
+        """(sp_song_id, song_name, youtube_id or None) for every entry of a playlist, in order"""
+        return await self._read(self._get_playlist_tracks, playlist_id)
+
+    def _get_playlist_tracks(self, playlist_id: str) -> list:
+        try:
+            with self.pool.reader() as conn:
+                return conn.execute("""
+                    SELECT s.sp_song_id, s.song_name, MIN(yss.youtube_id)
+                    FROM spotify_playlist_songs ps
+                    JOIN spotify_songs s ON s.sp_song_id = ps.song_id
+                    LEFT JOIN youtube_spotify_songs yss ON s.sp_song_id = yss.spotify_id
+                    WHERE ps.playlist_id = ?
+                    GROUP BY ps.id
+                    ORDER BY ps.sequence ASC, ps.id ASC
+                """, (playlist_id,)).fetchall()
         except sqlite3.Error as e:
-            print(f"Error getting playlist songs: {e}")
+            print(f"Error getting playlist tracks: {e}")
             return []
-        
 
-    def get_song_data(self, playlist_id: str):
-        try:
-            with SQLiteConnectionPool(f"{self.db_id}.db") as conn:
-                c = conn.cursor()
+    async def get_song_isrcs(self, song_ids) -> Dict[str, str]:
+        """{song_id: isrc} for the given songs that have one"""
+        ids = list(dict.fromkeys(song_ids))
 
-                query = """
-                        SELECT DISTINCT s.sp_song_id, s.song_name, GROUP_CONCAT(a.artist_name) as artists
-                        FROM spotify_songs s
-                        JOIN spotify_playlist_songs ps ON s.sp_song_id = ps.song_id
-                        JOIN spotify_playlists p ON ps.playlist_id = p.sp_playlist_id
-                        JOIN spotify_song_artist sa ON s.sp_song_id = sa.song_id
-                        JOIN spotify_artists a ON sa.artist_id = a.sp_artist_id
-                        LEFT JOIN youtube_spotify_songs yss ON s.sp_song_id = yss.spotify_id
-                        WHERE p.sp_playlist_id = ? 
-                        AND yss.youtube_id IS NULL
-                        GROUP BY s.sp_song_id, s.song_name
-                        """
-                
-                c.execute(query, (playlist_id, ))
-                data = c.fetchall()
-                processed_results = [(song_id, song_name, artists.split(',')) for song_id, song_name, artists in data]
-                return processed_results
-            
+        def read():
+            with self.pool.reader() as conn:
+                return dict(conn.execute(
+                    "SELECT s.sp_song_id, s.isrc FROM json_each(?) j "
+                    "JOIN spotify_songs s ON s.sp_song_id = j.value WHERE s.isrc IS NOT NULL",
+                    (json.dumps(ids),)))
+
+        try:
+            return await self._read(read)
         except sqlite3.Error as e:
-            print(f"Error getting song data to search songs: {e}")
-            return None
\ No newline at end of file
+            print(f"Error getting song ISRCs: {e}")
+            return {}
+
+    async def get_song_artists(self, song_ids) -> dict:
+        """{song_id: [artist names]} via iter_song_artists, off the event loop"""
+        return await self._read(lambda: dict(self.iter_song_artists(song_ids)))
+
+
+class IngestBuffer:
+    """
+    Collects Spotify rows across playlists and writes them in batches.
+
+    Rows are kept in memory until `row_budget` is reached and then written by
+    Database.insert_spotify_batch in one transaction. Songs, albums and artists
+    that repeat within a run are only written once.
+    """
+
+    def __init__(self, database: Database, row_budget: int = 5000) -> None:
+        self.database = database
+        self.row_budget = row_budget
+        self.next_sequence = {}
+        self.written = {"songs": set(), "albums": set(), "artists": set()}
+        self.rows_written = 0
+        self.flushes = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self.batch = {
+            "playlists": {},
+            "songs": {},
+            "albums": {},
+            "artists": {},
+            "song_artists": {},
+            "song_albums": {},
+            "playlist_songs": [],
+            "snapshots": {},
+        }
+        self.rows = 0
+
+    def _add(self, key: str, row_id, row) -> None:
+        if row_id in self.batch[key] or row_id in self.written.get(key, ()):
+            return
+        self.batch[key][row_id] = row
+        self.rows += 1
+
+    def add_playlist(self, playlist_id: str, name: str, description: str) -> None:
+        self._add("playlists", playlist_id, (playlist_id, name, description))
+
+    def add_snapshot(self, playlist_id: str, snapshot_id: Optional[str]) -> None:
+        """Store the playlist's snapshot_id; call once all its tracks are buffered"""
+        if snapshot_id:
+            self._add("snapshots", playlist_id, (snapshot_id, playlist_id))
+
+    def add_tracks(self, playlist_id: str, tracks) -> None:
+        """Buffer spotify.SpotifyTrack records in playlist order"""
+        sequence = self.next_sequence.get(playlist_id, 0)
+        for track in tracks:
+            self._add("songs", track.id, (track.id, track.name, track.isrc))
+            if track.album_id:
+                self._add("albums", track.album_id, (track.album_id, track.album_name, track.album_release_date))
+                self._add("song_albums", (track.id, track.album_id), (track.id, track.album_id))
+            for artist_id, artist_name in track.artists:
+                self._add("artists", artist_id, (artist_id, artist_name))
+                self._add("song_artists", (track.id, artist_id), (track.id, artist_id))
+            self.batch["playlist_songs"].append((playlist_id, track.id, sequence))
+            self.rows += 1
+            sequence += 1
+        self.next_sequence[playlist_id] = sequence
+
+    @property
+    def full(self) -> bool:
+        return self.rows >= self.row_budget
+
+    async def add(self, playlist_id: str, tracks) -> None:
+        """Buffer tracks and flush once the row budget is reached"""
+        self.add_tracks(playlist_id, tracks)
+        if self.full:
+            await self.flush()
+
+    def take(self) -> dict:
+        """Remove and return the buffered rows as lists, in insert_spotify_batch's format"""
+        batch = {key: list(rows.values()) if isinstance(rows, dict) else rows
+                 for key, rows in self.batch.items()}
+        self._reset()
+        return batch
+
+    async def flush(self) -> None:
+        if not self.rows:
+            return
+        # Swap the batch out first so other coroutines can keep buffering
+        rows = self.rows
+        batch = self.take()
+        await self.database.insert_spotify_batch(batch)
+        for key in self.written:
+            self.written[key].update(row[0] for row in batch[key])
+        self.rows_written += rows
+        self.flushes += 1
@@ -0,0 +1,181 @@
+"""
+Local stand-ins for Spotify and YouTube Music, used by the offline benchmarks.
+
+FakeSpotify answers the Web API endpoints spotify_user calls through an
+httpx.MockTransport, with configurable page latency and 429 responses.
+FakeYTMusic implements the ytmusicapi.YTMusic methods YouTubeManager uses,
+with configurable latency and error rates. Both serve a library of
+spotify.SpotifyTrack lists keyed by playlist ID and count every call.
+"""
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+from spotify import SpotifyTrack
+
+
+class FakeSpotify:
+    """Spotify Web API fake; pass `transport` to spotify_user"""
+
+    def __init__(self, library: Dict[str, List[SpotifyTrack]], page_latency: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 0.1, seed: int = 0) -> None:
+        self.library = library
+        self.page_latency = page_latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self.transport = httpx.MockTransport(self.handle)
+
+    @staticmethod
+    def track_json(track: SpotifyTrack) -> dict:
+        return {"track": {
+            "id": track.id,
+            "name": track.name,
+            "external_ids": {"isrc": track.isrc} if track.isrc else {},
+            "album": {"id": track.album_id, "name": track.album_name, "release_date": track.album_release_date},
+            "artists": [{"id": artist_id, "name": name} for artist_id, name in track.artists],
+        }}
+
+    def playlist_json(self, playlist_id: str) -> dict:
+        tracks = self.library[playlist_id]
+        return {"id": playlist_id, "name": f"Playlist {playlist_id}", "description": "",
+                "snapshot_id": hashlib.sha1(",".join(t.id for t in tracks).encode()).hexdigest(),
+                "tracks": {"total": len(tracks)}}
+
+    @staticmethod
+    def page(request: httpx.Request, items: list, default_limit: int) -> dict:
+        offset = int(request.url.params.get("offset", 0))
+        limit = int(request.url.params.get("limit", default_limit))
+        next_url = None
+        if offset + limit < len(items):
+            next_url = str(request.url.copy_merge_params({"offset": offset + limit, "limit": limit}))
+        return {"items": items[offset:offset + limit], "next": next_url,
+                "total": len(items), "limit": limit, "offset": offset}
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if request.url.host == "accounts.spotify.com":
+            self.calls["token"] += 1
+            return httpx.Response(200, json={"access_token": "fake", "refresh_token": "fake", "expires_in": 3600})
+
+        playlist = re.fullmatch(r"/v1/playlists/([^/]+)(/tracks)?", path)
+        endpoint = "playlist_tracks" if playlist and playlist.group(2) else "playlist" if playlist else path
+        self.calls[endpoint] += 1
+        if self.page_latency:
+            await asyncio.sleep(self.page_latency)
+        if self.rng.random() < self.throttle_rate:
+            self.calls["throttled"] += 1
+            return httpx.Response(429, headers={"Retry-After": str(self.retry_after)})
+
+        if path == "/v1/me":
+            return httpx.Response(200, json={"id": "benchmark"})
+        if path == "/v1/me/playlists":
+            return httpx.Response(200, json=self.page(request, [self.playlist_json(p) for p in self.library], 20))
+        if playlist and playlist.group(1) in self.library:
+            if not playlist.group(2):
+                return httpx.Response(200, json=self.playlist_json(playlist.group(1)))
+            items = [self.track_json(track) for track in self.library[playlist.group(1)]]
+            return httpx.Response(200, json=self.page(request, items, 100))
+        return httpx.Response(404, json={"error": {"status": 404, "message": "Not found"}})
+
+
+class FakeYTMusic:
+    """
+    ytmusicapi.YTMusic fake; pass it to YouTubeManager as `ytmusic`.
+
+    Every library song can be found by "<name> <artists>" and by its ISRC.
+    Text searches also return a karaoke decoy so scoring has work to do.
+    About `unavailable_rate` of the songs' videos cannot be added: like the
+    real service, add_playlist_items then rejects the whole batch with a
+    failed status instead of raising. Calls run in executor threads, so they
+    sleep instead of awaiting.
+    """
+
+    def __init__(self, library: Dict[str, List[SpotifyTrack]], search_latency: float = 0.0,
+                 write_latency: float = 0.0, error_rate: float = 0.0, unavailable_rate: float = 0.0,
+                 seed: int = 0) -> None:
+        self.search_latency = search_latency
+        self.write_latency = write_latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.playlists: Dict[str, List[dict]] = {}
+        self.next_set_video_id = 0
+        self.results = {}
+        self.unavailable = set()
+        for tracks in library.values():
+            for track in tracks:
+                artists = [name for _, name in track.artists]
+                result = {"videoId": f"yt_{track.id}", "title": track.name,
+                          "artists": [{"name": name} for name in artists]}
+                decoy = {"videoId": f"yt_karaoke_{track.id}", "title": f"{track.name} (Karaoke Version)",
+                         "artists": [{"name": "Sing King"}]}
+                self.results[f"{track.name} {' '.join(artists)}"] = [decoy, result]
+                if self.rng.random() < unavailable_rate:
+                    self.unavailable.add(result["videoId"])
+                if track.isrc:
+                    self.results[track.isrc] = [result]
+
+    def _call(self, name: str, latency: float) -> None:
+        with self.lock:
+            self.calls[name] += 1
+            failed = self.rng.random() < self.error_rate
+        if latency:
+            time.sleep(latency)
+        if failed:
+            raise Exception(f"Fake YouTube Music error in {name}")
+
+    def search(self, query: str, filter: Optional[str] = None, **kwargs) -> List[dict]:
+        self._call("search", self.search_latency)
+        return [dict(result) for result in self.results.get(query, [])]
+
+    def create_playlist(self, title: str, description: str, privacy_status: str = "PRIVATE", **kwargs) -> str:
+        self._call("create_playlist", self.write_latency)
+        with self.lock:
+            playlist_id = f"PL{len(self.playlists):06d}"
+            self.playlists[playlist_id] = []
+        return playlist_id
+
+    def add_playlist_items(self, playlistId: str, videoIds: List[str], duplicates: bool = False, **kwargs) -> dict:
+        self._call("add_playlist_items", self.write_latency)
+        if self.unavailable.intersection(videoIds):
+            return {"status": "STATUS_FAILED", "actions": []}
+        with self.lock:
+            for video_id in videoIds:
+                self.next_set_video_id += 1
+                self.playlists[playlistId].append({"videoId": video_id, "setVideoId": f"SV{self.next_set_video_id}"})
+        return {"status": "STATUS_SUCCEEDED"}
+
+    def get_playlist(self, playlistId: str, limit: Optional[int] = 100, **kwargs) -> dict:
+        self._call("get_playlist", self.search_latency)
+        with self.lock:
+            return {"id": playlistId, "tracks": [dict(item) for item in self.playlists[playlistId]]}
+
+    def remove_playlist_items(self, playlistId: str, videos: List[dict]) -> str:
+        self._call("remove_playlist_items", self.write_latency)
+        removed = {video["setVideoId"] for video in videos}
+        with self.lock:
+            self.playlists[playlistId] = [item for item in self.playlists[playlistId]
+                                          if item["setVideoId"] not in removed]
+        return "STATUS_SUCCEEDED"
+
+    def edit_playlist(self, playlistId: str, moveItem=None, **kwargs) -> str:
+        self._call("edit_playlist", self.write_latency)
+        if moveItem:
+            set_video_id, successor = moveItem if isinstance(moveItem, tuple) else (moveItem, None)
+            with self.lock:
+                items = self.playlists[playlistId]
+                item = next(i for i in items if i["setVideoId"] == set_video_id)
+                items.remove(item)
+                position = next((n for n, i in enumerate(items) if i["setVideoId"] == successor), len(items))
+                items.insert(position, item)
+        return "STATUS_SUCCEEDED"
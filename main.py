@@ -1,14 +1,22 @@
+import argparse
 import asyncio
+import functools
 import logging
 import re
+import time
+from collections import Counter
 from typing import List, Dict, Optional, Tuple
 from webbrowser import open
 import multiprocessing
 
-from spotify_auth import run
 import spotify
 import database
-from youtube import YouTubeManager
+from metrics import REGISTRY, SONGS, STAGE_SECONDS, timed
+from playlist_sync import diff_tracks
+from youtube import SearchPlan, YouTubeManager
+from search_cache import SearchCache
+from match_store import GlobalMatchStore
+from scheduler import Job, Scheduler
 
 # Configure logging
 logging.basicConfig(
@@ -18,32 +26,52 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class PlaylistTransferManager:
-    def __init__(self):
+    def __init__(self, match_store_path: Optional[str] = None, ingest_row_budget: int = 5000,
+                 pipeline_queue_size: int = 200, transfer_concurrency: int = 3, ingest_concurrency: int = 8,
+                 spotify_options: Optional[Dict] = None, youtube_options: Optional[Dict] = None):
         self.spotify_user = None
         self.database = None
         self.youtube_manager = None
+        # Matched video IDs waiting to be added; bounds how far search runs ahead
+        self.pipeline_queue_size = pipeline_queue_size
+        # Rows buffered across playlists before one ingest transaction is written
+        self.ingest_row_budget = ingest_row_budget
+        # Playlists transferred to YouTube / fetched from Spotify at the same time
+        self.transfer_concurrency = transfer_concurrency
+        self.ingest_concurrency = ingest_concurrency
+        # Shared Spotify -> YouTube match store, used when a path is given
+        self.match_store = GlobalMatchStore(match_store_path) if match_store_path else None
+        # Extra keyword arguments for spotify_user and YouTubeManager, e.g. fake clients for benchmarks
+        self.spotify_options = spotify_options or {}
+        self.youtube_options = youtube_options or {}
         
-    def initialize(self, user_id: Optional[str] = None) -> None:
-        """Initialize the transfer manager with either existing user_id or new authentication"""
+    async def initialize(self, user_id: Optional[str] = None, code: Optional[str] = None) -> None:
+        """
+        Initialize the transfer manager with either existing user_id or new authentication.
+
+        `code` is a Spotify authorization code obtained elsewhere; without one
+        the browser login is started.
+        """
         if user_id:
             self.database = database.Database(user_id)
             self.spotify_user = None  # Will authenticate on-demand if needed
             logger.info(f"Initialized with existing user ID: {user_id}")
         else:
-            code = self._start_spotify_auth_process()
-            self.spotify_user = spotify.spotify_user(code)
+            code = code or self._start_spotify_auth_process()
+            self.spotify_user = await spotify.spotify_user.create(code, **self.spotify_options)
             self.database = database.Database(self.spotify_user.id)
             logger.info("Initialized with new Spotify authentication")
             
-        self.youtube_manager = YouTubeManager(self.database)
+        self.youtube_manager = YouTubeManager(self.database, search_cache=SearchCache(self.database.db_id),
+                                              match_store=self.match_store, **self.youtube_options)
         
-    def ensure_spotify_authenticated(self) -> bool:
+    async def ensure_spotify_authenticated(self) -> bool:
         """Ensure Spotify is authenticated if not already"""
         if not self.spotify_user:
             try:
                 logger.info("Authenticating with Spotify (on-demand)...")
                 code = self._start_spotify_auth_process()
-                self.spotify_user = spotify.spotify_user(code)
+                self.spotify_user = await spotify.spotify_user.create(code, **self.spotify_options)
                 logger.info("Successfully authenticated with Spotify")
                 return True
             except Exception as e:
@@ -51,9 +79,23 @@ class PlaylistTransferManager:
                 return False
         return True
 
+    async def close(self) -> None:
+        """Release network clients, worker threads and database handles"""
+        if self.spotify_user:
+            await self.spotify_user.close()
+        if self.youtube_manager:
+            self.youtube_manager.close()
+        if self.match_store:
+            self.match_store.close()
+        if self.database:
+            self.database.close()
+
     @staticmethod
     def _start_spotify_auth_process() -> str:
         """Start Spotify authentication process and return the authorization code"""
+        # The auth server pulls in Flask, so it is only imported when a login is needed
+        from spotify_auth import run
+
         queue = multiprocessing.Queue()
         auth_process = multiprocessing.Process(target=run, args=(queue,))
         auth_process.start()
@@ -190,7 +232,7 @@ class PlaylistTransferManager:
         
         # For single playlist processing, we need Spotify authentication
         if not self.spotify_user:
-            if not self.ensure_spotify_authenticated():
+            if not await self.ensure_spotify_authenticated():
                 logger.error("Cannot process playlist without Spotify authentication")
                 return False
                 
@@ -222,46 +264,19 @@ class PlaylistTransferManager:
             # Process playlist songs
             await self._insert_songs_for_playlist(playlist)
             
-            # Create YouTube Music playlist and transfer songs
+            # Create (or resume) the YouTube Music playlist and transfer songs
             sanitized_name = playlist["name"].strip() if playlist["name"] else "Untitled Playlist"
             sanitized_desc = (playlist["description"] or "").strip()
             
-            yt_playlist_id = await self.youtube_manager.create_playlist(
-                name=sanitized_name,
-                description=sanitized_desc
-            )
-            
-            if not yt_playlist_id:
+            checkpoint = await self._start_or_resume_playlist(playlist_id, sanitized_name, sanitized_desc)
+            if checkpoint is None:
                 logger.error(f"Failed to create YouTube Music playlist: {sanitized_name}")
                 return False
-                
-            # Get and process songs
-            spotify_songs = await self.database.get_playlist_songs(playlist_id)
-            if any(t[0] is None for t in spotify_songs):
-                song_deets = self.database.get_song_data(playlist_id=playlist_id)
-                spotify_songs, yt_spot_mappings, failed_songs = await self.youtube_manager.batch_search_songs(song_deets)
-                await self.database.insert_youtube_songs(spotify_songs)
-                await self.database.insert_youtube_playlist_songs(playlist_id, spotify_songs)
-                await self.database.insert_youtube_spotify_songs(yt_spot_mappings)
-                
-            if spotify_songs:
-                logger.info(f"Adding {len(spotify_songs)} songs to playlist: {sanitized_name}")
-                
-                # Add songs in batches
-                for i in range(0, len(spotify_songs), self.youtube_manager.batch_size):
-                    batch = spotify_songs[i:i + self.youtube_manager.batch_size]
-                    success = await self.youtube_manager.add_songs_to_playlist(
-                        yt_playlist_id,
-                        [song[0] for song in batch]
-                    )
-                    
-                    if success:
-                        logger.info(f"Added batch {i//self.youtube_manager.batch_size + 1} to {sanitized_name}")
-                    else:
-                        logger.error(f"Failed to add batch to {sanitized_name}")
-                    
-                    await asyncio.sleep(2)  # Rate limiting between batches
-                    
+
+            yt_playlist_id, offset, done = checkpoint
+            if not done:
+                await self._transfer_playlist_songs(playlist_id, yt_playlist_id, sanitized_name, offset)
+
             logger.info(f"Successfully processed playlist: {playlist['name']}")
             return True
             
@@ -269,59 +284,207 @@ class PlaylistTransferManager:
             logger.error(f"Error processing playlist {playlist_id}: {e}")
             return False
 
-    async def _insert_songs_for_playlist(self, playlist: Dict) -> None:
-        """Insert all songs from a playlist into the database"""
+    async def _start_or_resume_playlist(self, playlist_id: str, name: str,
+                                        description: str) -> Optional[Tuple[str, int, bool]]:
+        """
+        Return (yt_playlist_id, added_offset, done) for a Spotify playlist.
+
+        A playlist with a checkpoint reuses its YouTube playlist instead of
+        creating a duplicate. Otherwise the playlist is created and recorded
+        together with its mapping before any songs are added. Returns None if
+        creation fails.
+        """
+        checkpoint = await self.database.get_transfer_checkpoint(playlist_id)
+        if checkpoint:
+            yt_playlist_id, offset, done = checkpoint
+            if done:
+                logger.info(f"Skipping {name}: already transferred to {yt_playlist_id}")
+            else:
+                logger.info(f"Resuming {name} in {yt_playlist_id} from position {offset}")
+            return yt_playlist_id, offset, bool(done)
+
+        logger.info(f"Creating playlist: {name}")
+        yt_playlist_id = await self.youtube_manager.create_playlist(name=name, description=description)
+        if not yt_playlist_id:
+            return None
+        await self.database.record_youtube_playlist(playlist_id, yt_playlist_id, name, description)
+        return yt_playlist_id, 0, False
+
+    async def _plan_searches(self, playlists: List[Tuple[str, int]]) -> SearchPlan:
+        """
+        Collect the unmatched songs of (playlist_id, offset) pairs into one SearchPlan.
+
+        Each unique sp_song_id is searched once, in order of first appearance,
+        however many of the playlists contain it. The plan is not started.
+        """
+        entries = matched = 0
+        unmatched = {}
+        for playlist_id, offset in playlists:
+            for sp_id, song_name, yt_id in (await self.database.get_playlist_tracks(playlist_id))[offset:]:
+                if yt_id is None:
+                    entries += 1
+                    unmatched.setdefault(sp_id, song_name)
+                else:
+                    matched += 1
+        SONGS.inc(matched, stage="plan", outcome="already_matched")
+        SONGS.inc(entries - len(unmatched), stage="plan", outcome="repeat")
+
+        artists = await self.database.get_song_artists(unmatched)
+        isrcs = await self.database.get_song_isrcs(unmatched)
+        songs = [(sp_id, song_name, artists.get(sp_id, []), isrcs.get(sp_id)) for sp_id, song_name in unmatched.items()]
+        if len(playlists) > 1:
+            logger.info(f"{entries} playlist entries across {len(playlists)} playlists need a match: "
+                        f"searching {len(songs)} unique songs ({entries - len(songs)} repeats skipped)")
+        return SearchPlan(self.youtube_manager, songs)
+
+    async def _transfer_playlist_songs(self, playlist_id: str, yt_playlist_id: str, name: str,
+                                       offset: int = 0, plan: Optional[SearchPlan] = None) -> int:
+        """
+        Search for unmatched songs and add everything to the YouTube playlist in one pipeline.
+
+        The producer walks the playlist in order from `offset`: already-matched
+        songs pass straight through, and unmatched ones are taken from `plan`,
+        a running SearchPlan that may be shared with other playlists, or from
+        one started for this playlist alone. Video IDs flow through a bounded
+        queue to an adder that calls add_playlist_items as soon as a batch is
+        full, so searching and adding overlap. Each added batch advances the
+        playlist's checkpoint in the same transaction that records its songs,
+        but never past a song that failed with an error: the next run retries
+        from there. Videos YouTube Music refuses are stored as refused, passed
+        by the checkpoint and skipped from then on. Songs past the checkpoint
+        that are already in the live playlist, such as a batch in flight when
+        the process died, are counted, repeats included, and not added again.
+        The playlist is marked done once every position has been added or
+        refused. Returns the number of songs added.
+        """
+        own_plan = plan is None
+        if own_plan:
+            plan = await self._plan_searches([(playlist_id, offset)])
+            plan.start()
         try:
-            await self.database.insert_spotify_playlists([
-                (playlist["id"], playlist["name"], playlist["description"])
-            ])
-            
-            songs = await self.spotify_user.get_playlist_songs(playlist["id"])
-            
-            # Prepare data for batch insertion
-            song_data = [(s["track"]["id"], s["track"]["name"]) for s in songs]
-            album_data = [
-                (
-                    s["track"]["album"]["id"],
-                    s["track"]["album"]["name"],
-                    s["track"]["album"]["release_date"]
-                )
-                for s in songs
-            ]
-            artist_data = [
-                (a["id"], a["name"]) 
-                for s in songs 
-                for a in s["track"]["artists"]
-            ]
-            song_artist_data = [
-                (s["track"]["id"], a["id"]) 
-                for s in songs 
-                for a in s["track"]["artists"]
-            ]
-            song_album_data = [
-                (s["track"]["id"], s["track"]["album"]["id"]) 
-                for s in songs
-            ]
-            playlist_song_data = [
-                (playlist["id"], s["track"]["id"]) 
-                for s in songs
-            ]
-
-            # Execute batch insertions
-            await asyncio.gather(
-                self.database.insert_spotify_songs(song_data),
-                self.database.insert_spotify_albums(album_data),
-                self.database.insert_spotify_artists(artist_data),
-                self.database.insert_spotify_song_artist(song_artist_data),
-                self.database.insert_spotify_song_album(song_album_data),
-                self.database.insert_spotify_playlist_songs(playlist_song_data)
-            )
+            return await self._run_transfer_pipeline(playlist_id, yt_playlist_id, name, offset, plan)
+        finally:
+            if own_plan:
+                await plan.close()
+
+    async def _run_transfer_pipeline(self, playlist_id: str, yt_playlist_id: str, name: str,
+                                     offset: int, plan: SearchPlan) -> int:
+        tracks = await self.database.get_playlist_tracks(playlist_id)
+        remaining = list(enumerate(tracks))[offset:]
+        unmatched = sum(1 for _, (_, _, yt_id) in remaining if yt_id is None)
+        logger.info(f"Transferring {len(remaining)} of {len(tracks)} songs to {name} ({unmatched} need a match)")
+        live = await self.youtube_manager.get_playlist_items(yt_playlist_id)
+        if live is None:
+            logger.error(f"Could not read {name} from YouTube Music; leaving it for the next run")
+            return 0
+        refused = await self.database.get_refused_songs()
+        # What the playlist holds beyond the songs before the checkpoint was added past it
+        already_added = Counter(item["videoId"] for item in live) - \
+            Counter(video_id for _, _, video_id in tracks[:offset] if video_id and video_id not in refused)
+
+        queue = asyncio.Queue(maxsize=self.pipeline_queue_size)
+        done = object()
+        start = time.monotonic()
+        added = 0
+        first_failed = None
+
+        async def produce() -> None:
+            try:
+                for position, (sp_id, _, video_id) in remaining:
+                    if video_id is None:
+                        video_id = await plan.result(sp_id)
+                    if video_id in refused:
+                        continue
+                    if already_added[video_id] > 0:
+                        already_added[video_id] -= 1
+                    elif video_id:
+                        await queue.put((position, video_id))
+            finally:
+                await queue.put(done)
+
+        async def add_batch(batch: List[Tuple[int, str]]) -> None:
+            nonlocal added, first_failed
+            batch_added, batch_failed, batch_refused = await self.youtube_manager.add_songs_bisect(
+                yt_playlist_id, [video_id for _, video_id in batch])
+            refused.update(batch_refused)
+            # The checkpoint never moves past a song that failed, so a later run retries it
+            failed = Counter(batch_failed)
+            for position, video_id in batch:
+                if failed[video_id]:
+                    failed[video_id] -= 1
+                    first_failed = position if first_failed is None else min(first_failed, position)
+            checkpoint = batch[-1][0] + 1 if first_failed is None else first_failed
+            await self.database.record_added_songs(yt_playlist_id, batch_added, checkpoint, batch_refused)
+            if batch_added:
+                if not added:
+                    logger.info(f"First songs in {name} after {time.monotonic() - start:.1f}s")
+                added += len(batch_added)
+                logger.info(f"Added {added}/{len(tracks)} songs to {name} "
+                            f"(batch size now {self.youtube_manager.add_batch.size})")
+            if batch_refused:
+                logger.warning(f"YouTube Music refused {len(batch_refused)} songs for {name}: {batch_refused}")
+            if batch_failed:
+                logger.error(f"Failed to add {len(batch_failed)} songs to {name}: {batch_failed}")
+
+        async def consume() -> None:
+            batch = []
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                batch.append(item)
+                if len(batch) >= self.youtube_manager.add_batch.size:
+                    await add_batch(batch)
+                    batch = []
+            if batch:
+                await add_batch(batch)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            await consume()
+        except BaseException:
+            # Nothing drains the queue any more, so stop the producer too
+            producer.cancel()
+            raise
+        await producer
+        if first_failed is None:
+            await self.database.update_youtube_spotify_playlist(yt_playlist_id, 1)
+        else:
+            logger.warning(f"{name} is incomplete; the next transfer retries from position {first_failed}")
+        return added
+
+    @timed(STAGE_SECONDS, stage="playlist_ingest")
+    async def _insert_songs_for_playlist(self, playlist: Dict,
+                                         buffer: Optional[database.IngestBuffer] = None) -> None:
+        """
+        Insert all songs from a playlist into the database.
+
+        Tracks are streamed page by page into `buffer`, which is flushed whenever
+        its row budget fills, so memory stays bounded by the page size and the
+        budget. Without a buffer, the playlist gets its own and is flushed at
+        the end, or when interrupted.
+        """
+        own_buffer = buffer is None
+        if own_buffer:
+            buffer = database.IngestBuffer(self.database, self.ingest_row_budget)
+        try:
+            buffer.add_playlist(playlist["id"], playlist["name"], playlist["description"])
+
+            async for tracks in self.spotify_user.iter_playlist_songs(playlist["id"]):
+                SONGS.inc(len(tracks), stage="ingest", outcome="fetched")
+                await buffer.add(playlist["id"], tracks)
+            # Lets the first sync skip playlists that have not changed since this ingest
+            buffer.add_snapshot(playlist["id"], playlist.get("snapshot_id"))
             
             logger.info(f"Successfully processed playlist: {playlist['name']}")
             
         except Exception as e:
             logger.error(f"Error processing playlist {playlist['name']}: {e}")
+        finally:
+            if own_buffer:
+                await buffer.flush()
 
+    @timed(STAGE_SECONDS, stage="spotify_ingest")
     async def process_spotify_playlists(self) -> None:
         """Process all selected Spotify playlists"""
         try:
@@ -329,11 +492,18 @@ class PlaylistTransferManager:
 
             logger.info(f"Starting transfer of playlists")
             
-            # Process playlists concurrently
-            await asyncio.gather(*[
-                self._insert_songs_for_playlist(playlist)
-                for playlist in playlists
-            ])
+            # Process a bounded number of playlists at once, grouping their rows into shared transactions
+            buffer = database.IngestBuffer(self.database, self.ingest_row_budget)
+            try:
+                await Scheduler(self.ingest_concurrency, "Spotify ingest").run([
+                    Job(playlist["id"], (playlist.get("tracks") or {}).get("total", 0),
+                        functools.partial(self._insert_songs_for_playlist, playlist, buffer))
+                    for playlist in playlists
+                ])
+            finally:
+                # Keep the pages already fetched even if the run is interrupted
+                await buffer.flush()
+            logger.info(f"Wrote {buffer.rows_written} rows in {buffer.flushes} transactions")
             
             self.database.spotify_complete()
             logger.info("Spotify playlist processing completed")
@@ -341,6 +511,117 @@ class PlaylistTransferManager:
         except Exception as e:
             logger.error(f"Error in process_spotify_playlists: {e}")
 
+    @timed(STAGE_SECONDS, stage="sync")
+    async def sync_playlists(self, create_missing: bool = False) -> bool:
+        """
+        Incrementally sync the transferred Spotify playlists to YouTube Music.
+
+        Only playlists already mapped to a YouTube playlist are synced.
+        Those whose snapshot_id matches the stored one and whose transfer
+        has finished are skipped without fetching their tracks. A changed
+        playlist is diffed against spotify_playlist_songs: only added songs
+        are searched, and only the difference is applied to the mapped
+        YouTube playlist. With `create_missing`, playlists that were never
+        transferred get a full, checkpointed transfer as well.
+
+        Returns:
+            bool: True if the sync ran, False if it could not start
+        """
+        if not await self.ensure_spotify_authenticated():
+            logger.error("Cannot sync playlists without Spotify authentication")
+            return False
+
+        try:
+            playlists = [p for p in await self.spotify_user.get_playlists() if p]
+            snapshots = await self.database.get_playlist_snapshots()
+            checkpoints = await self.database.get_transfer_checkpoints()
+        except Exception as e:
+            logger.error(f"Error starting sync: {e}")
+            return False
+
+        mapped = [playlist for playlist in playlists if create_missing or playlist["id"] in checkpoints]
+        if len(mapped) < len(playlists):
+            logger.info(f"Skipping {len(playlists) - len(mapped)} playlists that were never transferred")
+        pending = [
+            playlist for playlist in mapped
+            if not playlist.get("snapshot_id")
+            or snapshots.get(playlist["id"]) != playlist["snapshot_id"]
+            or not checkpoints.get(playlist["id"], (None, 0, 0))[2]
+        ]
+        logger.info(f"Syncing {len(pending)} of {len(mapped)} playlists; the rest are unchanged")
+
+        await Scheduler(self.transfer_concurrency, "Sync").run([
+            Job(playlist["id"], (playlist.get("tracks") or {}).get("total", 0),
+                functools.partial(self._sync_playlist, playlist, snapshots, checkpoints.get(playlist["id"])))
+            for playlist in pending
+        ])
+
+        logger.info(f"YouTube rate governor: {self.youtube_manager.governor.stats()}")
+        return True
+
+    @timed(STAGE_SECONDS, stage="playlist_sync")
+    async def _sync_playlist(self, playlist: Dict, snapshots: Dict[str, Optional[str]],
+                             checkpoint: Optional[Tuple[str, int, int]]) -> None:
+        """Bring one playlist's stored tracks and YouTube copy up to date"""
+        playlist_id = playlist["id"]
+        name = (playlist["name"] or "").strip() or "Untitled Playlist"
+        description = (playlist.get("description") or "").strip()
+        snapshot_id = playlist.get("snapshot_id")
+
+        if checkpoint and not checkpoint[2]:
+            # Finish the interrupted transfer against the stored tracks before diffing
+            yt_playlist_id, offset, _ = checkpoint
+            logger.info(f"Resuming {name} in {yt_playlist_id} from position {offset}")
+            await self._transfer_playlist_songs(playlist_id, yt_playlist_id, name, offset)
+            if playlist_id in snapshots and snapshots[playlist_id] == snapshot_id:
+                return
+
+        tracks = await self.spotify_user.get_playlist_songs(playlist_id)
+        buffer = database.IngestBuffer(self.database)
+        buffer.add_playlist(playlist_id, name, description)
+        buffer.add_tracks(playlist_id, tracks)
+        batch = buffer.take()
+
+        if not checkpoint:
+            await self.database.replace_spotify_playlist(playlist_id, name, description, snapshot_id, batch)
+            checkpoint = await self._start_or_resume_playlist(playlist_id, name, description)
+            if checkpoint is None:
+                logger.error(f"Failed to create YouTube Music playlist: {name}")
+                return
+            yt_playlist_id, offset, done = checkpoint
+            if not done:
+                await self._transfer_playlist_songs(playlist_id, yt_playlist_id, name, offset)
+            return
+
+        yt_playlist_id = checkpoint[0]
+        track_ids = [track.id for track in tracks]
+        delta = diff_tracks(await self.database.get_playlist_song_ids(playlist_id), track_ids)
+        logger.info(f"{name}: {len(delta.added)} added, {len(delta.removed)} removed, {delta.moved} moved")
+
+        if not delta.unchanged:
+            video_ids = await self.database.get_youtube_ids(track_ids)
+            added = set(delta.added)
+            to_search = [(track.id, track.name, [artist for _, artist in track.artists], track.isrc)
+                         for track in {t.id: t for t in tracks if t.id in added and t.id not in video_ids}.values()]
+            if to_search:
+                yt_songs, mappings, _ = await self.youtube_manager.batch_search_songs(to_search)
+                await self.database.insert_youtube_songs(yt_songs)
+                await self.database.insert_youtube_spotify_songs(mappings)
+                video_ids.update(mappings)
+
+            refused = await self.database.get_refused_songs()
+            desired = [video_ids[track_id] for track_id in track_ids
+                       if track_id in video_ids and video_ids[track_id] not in refused]
+            changes = await self.youtube_manager.sync_playlist(yt_playlist_id, desired)
+            if changes is None:
+                # Keep the old snapshot so the next sync tries again
+                logger.error(f"Failed to update YouTube playlist for {name}")
+                return
+            logger.info(f"Updated {name} in {yt_playlist_id}: {changes}")
+
+        await self.database.replace_spotify_playlist(playlist_id, name, description, snapshot_id, batch)
+
+    @timed(STAGE_SECONDS, stage="youtube_transfer")
     async def process_youtube_transfer(self, playlist_ids: Optional[List[str]] = None) -> bool:
         """
         Handle the YouTube transfer process for specific playlists or all playlists.
@@ -376,56 +657,25 @@ class PlaylistTransferManager:
             if not playlists:
                 logger.warning("No playlists selected for transfer")
                 return False
-                
-            # Process each playlist
-            for playlist_id, name, description in playlists:
-                try:
-                    # Sanitize playlist name and description
-                    sanitized_name = name.strip() if name else "Untitled Playlist"
-                    sanitized_desc = (description or "").strip()
-                    
-                    # Create playlist with sanitized inputs
-                    logger.info(f"Creating playlist: {sanitized_name}")
-                    yt_playlist_id = await self.youtube_manager.create_playlist(
-                        name=sanitized_name,
-                        description=sanitized_desc
-                    )
-                    
-                    if not yt_playlist_id:
-                        logger.error(f"Failed to create playlist: {sanitized_name}")
-                        continue
 
-                    # Get songs for this playlist and add them
-                    spotify_songs = await self.database.get_playlist_songs(playlist_id)
-                    if any(t[0] is None for t in spotify_songs):
-                        song_deets = self.database.get_song_data(playlist_id=playlist_id)
-                        searched_songs, yt_spot_mappings, failed_songs = await self.youtube_manager.batch_search_songs(song_deets)
-                        await self.database.insert_youtube_songs(searched_songs)
-                        await self.database.insert_youtube_playlist_songs(playlist_id, searched_songs)
-                        await self.database.insert_youtube_spotify_songs(yt_spot_mappings)
-
-                    spotify_songs = await self.database.get_playlist_songs(playlist_id)                    
-                        
-                    if spotify_songs:
-                        logger.info(f"Adding {len(spotify_songs)} songs to playlist: {sanitized_name}")
-                        # Add songs in batches
-                        for i in range(0, len(spotify_songs), self.youtube_manager.batch_size):
-                            batch = spotify_songs[i:i + self.youtube_manager.batch_size]
-                            success = await self.youtube_manager.add_songs_to_playlist(
-                                yt_playlist_id, 
-                                [song[0] for song in batch]
-                            )
-                            if success:
-                                logger.info(f"Added batch {i//self.youtube_manager.batch_size + 1} to {sanitized_name}")
-                            else:
-                                logger.error(f"Failed to add batch to {sanitized_name}")
-                            
-                            await asyncio.sleep(2)  # Rate limiting between batches
-                    
-                except Exception as playlist_error:
-                    logger.error(f"Error processing playlist {name}: {playlist_error}")
-                    continue
+            # Smallest first, matching the order the scheduler starts them in
+            sizes = await self.database.get_playlist_sizes()
+            playlists = sorted(playlists, key=lambda p: sizes.get(p[0], 0))
+
+            # Search every unmatched song of the unfinished playlists once, shared between playlists
+            checkpoints = await self.database.get_transfer_checkpoints()
+            plan = await self._plan_searches([
+                (playlist_id, checkpoints.get(playlist_id, (None, 0, 0))[1])
+                for playlist_id, _, _ in playlists
+                if not checkpoints.get(playlist_id, (None, 0, 0))[2]
+            ])
+            plan.start()
+            try:
+                await self._transfer_playlists(playlists, plan, sizes)
+            finally:
+                await plan.close()
                 
+            logger.info(f"YouTube rate governor: {self.youtube_manager.governor.stats()}")
             logger.info("YouTube transfer completed successfully")
             return True
             
@@ -433,6 +683,33 @@ class PlaylistTransferManager:
             logger.error(f"Error in YouTube transfer: {e}")
             return False
 
+    async def _transfer_playlists(self, playlists: List[Tuple[str, str, str]], plan: SearchPlan,
+                                  sizes: Dict[str, int]) -> None:
+        """Transfer (playlist_id, name, description) playlists concurrently, sharing `plan`"""
+        results = await Scheduler(self.transfer_concurrency, "YouTube transfer").run([
+            Job(playlist_id, sizes.get(playlist_id, 0),
+                functools.partial(self._transfer_playlist, playlist_id, name, description, plan))
+            for playlist_id, name, description in playlists
+        ])
+        logger.info(f"Transferred {sum(result.ok for result in results)}/{len(results)} playlists")
+
+    @timed(STAGE_SECONDS, stage="playlist_transfer")
+    async def _transfer_playlist(self, playlist_id: str, name: str, description: str, plan: SearchPlan) -> int:
+        """Create or resume one playlist and transfer its songs; returns the number added"""
+        # Sanitize playlist name and description
+        sanitized_name = name.strip() if name else "Untitled Playlist"
+        sanitized_desc = (description or "").strip()
+
+        # Create playlist with sanitized inputs, or pick up an interrupted transfer
+        checkpoint = await self._start_or_resume_playlist(playlist_id, sanitized_name, sanitized_desc)
+        if checkpoint is None:
+            raise RuntimeError(f"Failed to create playlist: {sanitized_name}")
+
+        yt_playlist_id, offset, done = checkpoint
+        if done:
+            return 0
+        return await self._transfer_playlist_songs(playlist_id, yt_playlist_id, sanitized_name, offset, plan)
+
     async def execute_transfer(self) -> None:
         """Execute the complete transfer process based on current status"""
         status = self.database.get_status()
@@ -451,8 +728,10 @@ class PlaylistTransferManager:
 
 async def main():
     """Main entry point for the application"""
+    transfer_manager = None
     try:
         # Initialize the transfer manager
+        # Pass match_store_path="global_matches.db" to share matches between users
         transfer_manager = PlaylistTransferManager()
         
         # CHOOSE INITIALIZATION METHOD:
@@ -460,10 +739,10 @@ async def main():
         
         # Option 1: Initialize with existing user ID (Spotify auth only when needed)
         # Useful when you just want to access existing database without re-authenticating
-        transfer_manager.initialize(user_id="wp07i46i1vp008d0bkpkc5z25")
+        await transfer_manager.initialize(user_id="wp07i46i1vp008d0bkpkc5z25")
         
         # Option 2: Initialize with new authentication (always authenticates with Spotify)
-        # transfer_manager.initialize()
+        # await transfer_manager.initialize()
         
         # Ensure YouTube authentication is set up
         transfer_manager.youtube_manager.authenticate("browser.json")
@@ -478,6 +757,9 @@ async def main():
         # playlist_url = "https://open.spotify.com/playlist/75mqVGr1vxj5ybqBjUDzoH"
         # success = await transfer_manager.process_playlist_from_url(playlist_url)
         
+        # Option C: Incremental sync, only applying what changed on Spotify (will trigger Spotify auth if needed)
+        # success = await transfer_manager.sync_playlists()
+        
         if success:
             logger.info("Playlist transfer completed successfully")
         else:
@@ -486,6 +768,24 @@ async def main():
     except Exception as e:
         logger.error(f"Error in main: {e}")
         raise
+    finally:
+        if transfer_manager:
+            await transfer_manager.close()
+        # Prometheus text and a JSON summary of API, database, cache and sleep timings
+        for path in REGISTRY.export("metrics"):
+            logger.info(f"Wrote run metrics to {path}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Transfer Spotify playlists to YouTube Music")
+    parser.add_argument("--profile", nargs="?", const="profile", metavar="PREFIX",
+                        help="profile the run and write PREFIX.txt, PREFIX.folded (flame graph) "
+                             "and PREFIX.pstats (default prefix: profile)")
+    parser.add_argument("--profile-interval", type=float, default=0.005, metavar="SECONDS",
+                        help="stack sampling interval when profiling")
+    args = parser.parse_args()
+
+    if args.profile:
+        from profiling import RunProfiler
+        RunProfiler(args.profile, interval=args.profile_interval).run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,70 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from metrics import CACHE_LOOKUPS
+
+
+class GlobalMatchStore:
+    """
+    Spotify -> YouTube Music matches shared by every user.
+
+    The per-user databases only know about songs their owner has transferred.
+    This store lives in a separate SQLite file so a track matched for one
+    account is reused for every other account without searching again.
+    """
+
+    def __init__(self, db_file: str = "global_matches.db", min_confidence: float = 0.6) -> None:
+        self.db_file = db_file
+        self.min_confidence = min_confidence
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_file, check_same_thread=False, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS matches"
+                                "(sp_song_id TEXT PRIMARY KEY, video_id TEXT NOT NULL, "
+                                "confidence REAL NOT NULL, updated_at REAL NOT NULL);")
+        self.connection.commit()
+
+    def get_many(self, sp_song_ids: Iterable[str]) -> Dict[str, Tuple[str, float]]:
+        """Return {sp_song_id: (video_id, confidence)} for the known, confident matches"""
+        ids = list(dict.fromkeys(sp_song_ids))
+        matches = {}
+        try:
+            with self.lock:
+                # Stay well below SQLite's bound-parameter limit
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    rows = self.connection.execute(
+                        f"SELECT sp_song_id, video_id, confidence FROM matches "
+                        f"WHERE sp_song_id IN ({', '.join('?' * len(chunk))}) AND confidence >= ?",
+                        (*chunk, self.min_confidence)
+                    ).fetchall()
+                    matches.update({sp_id: (video_id, confidence) for sp_id, video_id, confidence in rows})
+        except sqlite3.Error as e:
+            print(f"Error reading global matches: {e}")
+        CACHE_LOOKUPS.inc(len(matches), cache="global_matches", result="hit")
+        CACHE_LOOKUPS.inc(len(ids) - len(matches), cache="global_matches", result="miss")
+        return matches
+
+    def put_many(self, matches: List[Tuple[str, str, float]]) -> None:
+        """Store (sp_song_id, video_id, confidence) rows, keeping the more confident match"""
+        if not matches:
+            return
+        now = time.time()
+        try:
+            with self.lock:
+                self.connection.executemany(
+                    "INSERT INTO matches (sp_song_id, video_id, confidence, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(sp_song_id) DO UPDATE SET video_id = excluded.video_id, "
+                    "confidence = excluded.confidence, updated_at = excluded.updated_at "
+                    "WHERE excluded.confidence >= matches.confidence",
+                    [(sp_id, video_id, confidence, now) for sp_id, video_id, confidence in matches]
+                )
+                self.connection.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing global matches: {e}")
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
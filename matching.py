@@ -0,0 +1,155 @@
+"""
+Scoring of YouTube Music search results against Spotify songs.
+
+Titles and artist names are normalized once (accents, case, punctuation,
+"feat." credits and remaster/official-video tags removed) and cached with
+their token and trigram sets, so scoring a candidate is a handful of set
+operations. Identical normalized strings short-circuit to 1.0.
+
+The policy that turns title and artist similarity into one score is
+pluggable: pass any ScoringPolicy to best_match. LegacyPolicy reproduces the
+original SequenceMatcher scoring for comparison.
+"""
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+# Bracketed or dash-separated tags that never distinguish one recording from another
+_NOISE = r"(?:feat|ft|featuring|remaster(?:ed)?|official|video|audio|lyrics?|explicit|clean|mono|stereo|hd|hq)\b"
+_NOISE_BRACKETS = re.compile(rf"[\(\[\{{](?:\s*with\b|[^\)\]\}}]*\b{_NOISE})[^\)\]\}}]*[\)\]\}}]")
+_NOISE_SUFFIX = re.compile(rf"\s-\s[^-]*\b{_NOISE}.*$")
+_FEATURING = re.compile(r"\s(?:feat|ft|featuring)\b.*$")
+_PUNCTUATION = re.compile(r"[^\w\s]|_")
+_SPACES = re.compile(r"\s+")
+
+# Tokens that mark a different rendition of a song
+VERSION_TOKENS = frozenset({"live", "remix", "acoustic", "instrumental", "karaoke", "cover",
+                            "slowed", "sped", "nightcore", "reverb", "8d"})
+
+
+class NormalizedText(NamedTuple):
+    text: str
+    tokens: FrozenSet[str]
+    trigrams: FrozenSet[str]
+
+
+class Query(NamedTuple):
+    """A song prepared for scoring, keeping the raw strings for LegacyPolicy"""
+    name: str
+    artists: Tuple[str, ...]
+    title: NormalizedText
+    artist_names: Tuple[NormalizedText, ...]
+
+
+def strip_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+@lru_cache(maxsize=65536)
+def normalize(text: str) -> NormalizedText:
+    """Normalize a title or artist name and precompute its token and trigram sets"""
+    text = strip_accents(text or "").casefold()
+    text = _NOISE_BRACKETS.sub(" ", text)
+    text = _NOISE_SUFFIX.sub("", text)
+    text = _FEATURING.sub("", text)
+    text = text.replace("&", " and ")
+    text = _SPACES.sub(" ", _PUNCTUATION.sub(" ", text)).strip()
+    padded = f"  {text} "
+    return NormalizedText(text, frozenset(text.split()),
+                          frozenset(padded[i:i + 3] for i in range(len(padded) - 2)) if text else frozenset())
+
+
+def prepare_query(song_name: str, artists: Sequence[str]) -> Query:
+    return Query(song_name or "", tuple(artists), normalize(song_name or ""), tuple(map(normalize, artists)))
+
+
+def dice(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def similarity(a: NormalizedText, b: NormalizedText) -> float:
+    """
+    Similarity in [0, 1]: the better of token-set and trigram overlap.
+
+    Token overlap ignores word order; trigrams absorb typos and spacing.
+    """
+    if a.text == b.text:
+        return 1.0 if a.text else 0.0
+    return max(dice(a.tokens, b.tokens), dice(a.trigrams, b.trigrams))
+
+
+def best_similarity(names: Sequence[NormalizedText], others: Sequence[NormalizedText]) -> float:
+    """Highest similarity over all pairs, stopping at the first exact match"""
+    best = 0.0
+    for name in names:
+        for other in others:
+            score = similarity(name, other)
+            if score == 1.0:
+                return score
+            best = max(best, score)
+    return best
+
+
+class ScoringPolicy:
+    """Scores one search result against a query; 1.0 means a certain match"""
+
+    def score(self, query: Query, candidate: dict) -> float:
+        raise NotImplementedError
+
+
+class DefaultPolicy(ScoringPolicy):
+    """
+    Weighted title and artist similarity on normalized text.
+
+    Results that add a version tag (live, remix, karaoke, ...) that the song
+    does not have are scaled by `version_penalty`.
+    """
+
+    def __init__(self, title_weight: float = 0.5, version_penalty: float = 0.5) -> None:
+        self.title_weight = title_weight
+        self.version_penalty = version_penalty
+
+    def score(self, query: Query, candidate: dict) -> float:
+        title = normalize(candidate.get("title") or "")
+        artists = [normalize(a.get("name") or "") for a in candidate.get("artists") or []]
+        title_similarity = similarity(query.title, title)
+        artist_similarity = best_similarity(query.artist_names, artists)
+        score = self.title_weight * title_similarity + (1 - self.title_weight) * artist_similarity
+        if (title.tokens & VERSION_TOKENS) - query.title.tokens:
+            score *= self.version_penalty
+        return score
+
+
+class LegacyPolicy(ScoringPolicy):
+    """The original scoring: mean of SequenceMatcher ratios on lowercased raw strings"""
+
+    def score(self, query: Query, candidate: dict) -> float:
+        name_similarity = SequenceMatcher(None, query.name.lower(), candidate['title'].lower()).ratio()
+        artist_similarities = [
+            SequenceMatcher(None, artist.lower(), result_artist['name'].lower()).ratio()
+            for artist in query.artists
+            for result_artist in candidate['artists']
+        ]
+        artist_similarity = max(artist_similarities) if artist_similarities else 0
+        return (name_similarity + artist_similarity) / 2
+
+
+DEFAULT_POLICY = DefaultPolicy()
+
+
+def best_match(query: Query, results: List[dict], policy: Optional[ScoringPolicy] = None,
+               limit: int = 3) -> Tuple[Optional[dict], float]:
+    """Return the best of the top `limit` results and its score, stopping early on a certain match"""
+    policy = policy or DEFAULT_POLICY
+    best, highest = None, 0.0
+    for result in results[:limit]:
+        score = policy.score(query, result)
+        if score > highest:
+            best, highest = result, score
+            if score >= 1.0:
+                break
+    return best, highest
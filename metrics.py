@@ -0,0 +1,319 @@
+"""
+In-process metrics for a transfer run.
+
+Counters and latency histograms, optionally labelled, live in a
+MetricsRegistry (REGISTRY by default) and can be exported as Prometheus
+text or as a JSON summary at the end of a run. Instruments are thread-safe,
+since SQLite and ytmusicapi calls run in worker threads.
+
+The instruments shared by the modules are defined at the bottom. Use
+`timed` to time a function or coroutine and `instrument_methods` to time
+every public method of a class.
+"""
+import functools
+import inspect
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; covers cached SQLite reads up to slow, retried API calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        unknown = set(labels) - set(self.labelnames)
+        if unknown:
+            raise ValueError(f"Unknown labels for {self.name}: {sorted(unknown)}")
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def _label_string(self, key: Tuple[str, ...]) -> str:
+        """Compact key for the JSON summary, e.g. "service=spotify,endpoint=/v1/me" """
+        return ",".join(f"{name}={value}" for name, value in zip(self.labelnames, key)) or "total"
+
+    def samples(self, name: str) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+    def summary(self) -> Dict:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A monotonically increasing total per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] += amount
+
+    def value(self, **labels) -> float:
+        with self.lock:
+            return self.values.get(self._key(labels), 0.0)
+
+    def samples(self, name: str) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            yield f"{name}_total", self._labels(key), value
+
+    def summary(self) -> Dict[str, float]:
+        with self.lock:
+            return {self._label_string(key): round(value, 6) for key, value in sorted(self.values.items())}
+
+    def reset(self) -> None:
+        with self.lock:
+            self.values.clear()
+
+
+class _Series:
+    __slots__ = ("buckets", "count", "sum", "max")
+
+    def __init__(self, size: int) -> None:
+        self.buckets = [0] * size
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class Histogram(Metric):
+    """Observations sorted into fixed buckets, with their count, sum and maximum"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.bounds = tuple(sorted(buckets)) + (math.inf,)
+        self.series: Dict[Tuple[str, ...], _Series] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = _Series(len(self.bounds))
+            series.buckets[next(i for i, bound in enumerate(self.bounds) if value <= bound)] += 1
+            series.count += 1
+            series.sum += value
+            series.max = max(series.max, value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the block, whether or not it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Estimate a quantile by interpolating within its bucket; None without observations"""
+        with self.lock:
+            series = self.series.get(self._key(labels))
+            return self._quantile(series, q) if series else None
+
+    def _quantile(self, series: _Series, q: float) -> float:
+        rank = q * series.count
+        seen = 0
+        for i, count in enumerate(series.buckets):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = min(self.bounds[i], series.max)
+                return lower + (upper - lower) * max(0.0, rank - seen) / count
+            seen += count
+        return series.max
+
+    def samples(self, name: str) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        with self.lock:
+            series = sorted((key, list(s.buckets), s.count, s.sum) for key, s in self.series.items())
+        for key, buckets, count, total in series:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket in zip(self.bounds, buckets):
+                cumulative += bucket
+                yield f"{name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{name}_sum", labels, total
+            yield f"{name}_count", labels, count
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {
+                self._label_string(key): {
+                    "count": s.count,
+                    "sum": round(s.sum, 6),
+                    "mean": round(s.sum / s.count, 6),
+                    "p50": round(self._quantile(s, 0.5), 6),
+                    "p95": round(self._quantile(s, 0.95), 6),
+                    "max": round(s.max, 6),
+                }
+                for key, s in sorted(self.series.items()) if s.count
+            }
+
+    def reset(self) -> None:
+        with self.lock:
+            self.series.clear()
+
+
+class MetricsRegistry:
+    """
+    Named instruments, exported with a common name prefix.
+
+    counter() and histogram() return the existing instrument when called
+    again with the same name, so modules can declare what they use.
+    """
+
+    def __init__(self, namespace: str = "playlist_transfer") -> None:
+        self.namespace = namespace
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs) -> Metric:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labelnames, buckets)
+
+    def full_name(self, metric: Metric) -> str:
+        return f"{self.namespace}_{metric.name}" if self.namespace else metric.name
+
+    def reset(self) -> None:
+        """Clear every recorded value, keeping the instruments"""
+        for metric in list(self.metrics.values()):
+            metric.reset()
+
+    def to_prometheus(self) -> str:
+        """All instruments in the Prometheus text exposition format"""
+        lines = []
+        for metric in sorted(self.metrics.values(), key=lambda m: m.name):
+            name = self.full_name(metric)
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(f"{sample}{_format_labels(labels)} {_format_value(value)}"
+                         for sample, labels, value in metric.samples(name))
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Dict]:
+        """{metric: {labels: value or histogram stats}}, leaving out instruments with no data"""
+        summary = {}
+        for metric in sorted(self.metrics.values(), key=lambda m: m.name):
+            values = metric.summary()
+            if values:
+                summary[self.full_name(metric)] = values
+        return summary
+
+    def export(self, prefix: str = "metrics") -> List[str]:
+        """Write `<prefix>.prom` and `<prefix>.json` and return their paths"""
+        paths = [f"{prefix}.prom", f"{prefix}.json"]
+        with open(paths[0], "w") as file:
+            file.write(self.to_prometheus())
+        with open(paths[1], "w") as file:
+            json.dump(self.summary(), file, indent=2)
+        return paths
+
+
+REGISTRY = MetricsRegistry()
+
+
+def timed(histogram: Histogram, **labels):
+    """
+    Decorator observing how long each call takes.
+
+    Works for plain functions, coroutine functions (timed until the
+    coroutine finishes) and generator functions (timed until exhausted).
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return await func(*args, **kwargs)
+        elif inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return (yield from func(*args, **kwargs))
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_methods(histogram: Histogram, label: str = "method", exclude: Sequence[str] = ()):
+    """Class decorator timing every public method defined on the class, labelled by method name"""
+    def decorator(cls):
+        for name, attribute in list(vars(cls).items()):
+            if name.startswith("_") or name in exclude or not inspect.isfunction(attribute):
+                continue
+            setattr(cls, name, timed(histogram, **{label: name})(attribute))
+        return cls
+    return decorator
+
+
+# Instruments shared across the application
+API_REQUESTS = REGISTRY.counter(
+    "api_requests", "Calls to Spotify and YouTube Music by outcome", ("service", "endpoint", "outcome"))
+API_SECONDS = REGISTRY.histogram(
+    "api_request_seconds", "Latency of Spotify and YouTube Music calls", ("service", "endpoint"))
+API_RETRIES = REGISTRY.counter(
+    "api_retries", "Calls repeated after a throttle, error or expired token", ("service", "endpoint", "reason"))
+SLEEP_SECONDS = REGISTRY.counter(
+    "sleep_seconds", "Time spent in deliberate sleeps (throttle pauses, backoff, pacing)", ("service", "reason"))
+DB_SECONDS = REGISTRY.histogram(
+    "db_call_seconds", "Latency of Database methods, including waits for the writer thread", ("method",))
+CACHE_LOOKUPS = REGISTRY.counter(
+    "cache_lookups", "Search cache and global match store lookups", ("cache", "result"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "stage_seconds", "Duration of transfer stages and per-playlist jobs", ("stage",))
+SONGS = REGISTRY.counter(
+    "songs", "Songs by stage and outcome", ("stage", "outcome"))
@@ -0,0 +1,220 @@
+"""
+Versioned schema migrations for the per-user database.
+
+The schema version is kept in SQLite's `PRAGMA user_version`. Each migration
+runs inside the writer's transaction and bumps the version when it finishes,
+so an interrupted upgrade is retried from the same step on the next start.
+Databases created before versioning have version 0 but already contain the
+baseline tables, so they are treated as version 1.
+"""
+import sqlite3
+
+
+def get_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _table_exists(conn, table_name: str) -> bool:
+    return bool(conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?;",
+                             (table_name,)).fetchone())
+
+
+def _create_baseline(conn) -> None:
+    """The original schema, joined on TEXT Spotify IDs"""
+    if _table_exists(conn, "status"):
+        return
+    c = conn.cursor()
+    c.execute("CREATE TABLE status "
+              "(id INTEGER PRIMARY KEY, status INTEGER NOT NULL);")
+    c.execute("INSERT INTO status (id, status) VALUES (1, 1);")
+    # create tables for spotify data
+    c.execute("CREATE TABLE spotify_playlists"
+              "(id INTEGER PRIMARY KEY AUTOINCREMENT, sp_playlist_id TEXT NOT NULL UNIQUE, "
+              "playlist_name TEXT NOT NULL, playlist_description TEXT);")
+    c.execute("CREATE TABLE spotify_albums"
+              "(id INTEGER PRIMARY KEY AUTOINCREMENT, sp_album_id TEXT NOT NULL UNIQUE, album_name TEXT NOT NULL, album_date TEXT NOT NULL);")
+    c.execute("CREATE TABLE spotify_artists"
+              "(id INTEGER PRIMARY KEY AUTOINCREMENT, sp_artist_id TEXT NOT NULL UNIQUE, artist_name TEXT NOT NULL);")
+    c.execute("CREATE TABLE spotify_songs"
+              "(id INTEGER PRIMARY KEY AUTOINCREMENT, sp_song_id TEXT NOT NULL UNIQUE, song_name TEXT NOT NULL);")
+    c.execute("CREATE TABLE spotify_song_album"
+              "(song_id TEXT NOT NULL, album_id TEXT NOT NULL,"
+              "PRIMARY KEY (song_id, album_id),"
+              "FOREIGN KEY (song_id) REFERENCES spotify_songs(id),"
+              "FOREIGN KEY (album_id) REFERENCES spotify_albums(id));")
+    c.execute("CREATE TABLE spotify_song_artist"
+              "(song_id TEXT NOT NULL, artist_id TEXT NOT NULL,"
+              "PRIMARY KEY (song_id, artist_id),"
+              "FOREIGN KEY (song_id) REFERENCES spotify_songs(id),"
+              "FOREIGN KEY (artist_id) REFERENCES spotify_artists(id));")
+    c.execute("CREATE TABLE spotify_playlist_songs"
+              "(id INTEGER PRIMARY KEY AUTOINCREMENT, playlist_id TEXT NOT NULL, song_id TEXT NOT NULL, sequence INTEGER,"
+              "FOREIGN KEY (playlist_id) REFERENCES spotify_playlists(id),"
+              "FOREIGN KEY (song_id) REFERENCES spotify_songs(id)"
+              "UNIQUE(playlist_id, song_id, sequence));")
+    
+    # create tables for youtube
+    c.execute("CREATE TABLE youtube_playlists"
+              "(id INTEGER PRIMARY KEY AUTOINCREMENT, yt_playlist_id TEXT NOT NULL,"
+              "playlist_name TEXT NOT NULL, playlist_description TEXT);")
+    c.execute("CREATE TABLE youtube_songs"
+              "(id INTEGER PRIMARY KEY AUTOINCREMENT, yt_song_id TEXT NOT NULL, song_name TEXT NOT NULL);")
+    c.execute("CREATE TABLE youtube_playlist_songs"
+              "(playlist_id INTEGER NOT NULL, song_id INTEGER NOT NULL,"
+              "PRIMARY KEY (playlist_id, song_id),"
+              "FOREIGN KEY (playlist_id) REFERENCES youtube_playlists(id),"
+              "FOREIGN KEY (song_id) REFERENCES youtube_songs(id));")
+    c.execute("CREATE TABLE youtube_spotify_playlists"
+              "(spotify_id INTEGER NOT NULL, youtube_id INTEGER NOT NULL, done INTEGER NOT NULL,"
+              "PRIMARY KEY (spotify_id, youtube_id),"
+              "FOREIGN KEY (spotify_id) REFERENCES spotify_playlists(id),"
+              "FOREIGN KEY (youtube_id) REFERENCES youtube_playlists(id));")
+    c.execute("CREATE TABLE youtube_spotify_songs"
+              "(spotify_id INTEGER NOT NULL, youtube_id INTEGER NOT NULL,"
+              "PRIMARY KEY (spotify_id, youtube_id),"
+              "FOREIGN KEY (spotify_id) REFERENCES spotify_songs(id),"
+              "FOREIGN KEY (youtube_id) REFERENCES youtube_songs(id));")
+    print("Initialised.")
+
+
+def _rebuild_table(conn, table: str, create_sql: str, columns: str, select: str) -> None:
+    conn.execute(f"CREATE TABLE {table}_new {create_sql}")
+    conn.execute(f"INSERT OR IGNORE INTO {table}_new ({columns}) {select}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+
+def _text_keys(conn) -> None:
+    """
+    Declare the link tables with the TEXT keys they actually store.
+
+    The baseline declared INTEGER columns and foreign keys to the unused
+    integer `id` columns. The keys now reference the unique Spotify and
+    YouTube IDs. youtube_songs and youtube_playlists are deduplicated so their
+    IDs can be unique.
+    """
+    _rebuild_table(conn, "youtube_songs",
+                   "(id INTEGER PRIMARY KEY AUTOINCREMENT, yt_song_id TEXT NOT NULL UNIQUE, song_name TEXT NOT NULL)",
+                   "yt_song_id, song_name",
+                   "SELECT yt_song_id, song_name FROM youtube_songs ORDER BY id")
+    _rebuild_table(conn, "youtube_playlists",
+                   "(id INTEGER PRIMARY KEY AUTOINCREMENT, yt_playlist_id TEXT NOT NULL UNIQUE,"
+                   "playlist_name TEXT NOT NULL, playlist_description TEXT)",
+                   "yt_playlist_id, playlist_name, playlist_description",
+                   "SELECT yt_playlist_id, playlist_name, playlist_description FROM youtube_playlists ORDER BY id")
+    _rebuild_table(conn, "spotify_song_album",
+                   "(song_id TEXT NOT NULL, album_id TEXT NOT NULL,"
+                   "PRIMARY KEY (song_id, album_id),"
+                   "FOREIGN KEY (song_id) REFERENCES spotify_songs(sp_song_id),"
+                   "FOREIGN KEY (album_id) REFERENCES spotify_albums(sp_album_id))",
+                   "song_id, album_id",
+                   "SELECT CAST(song_id AS TEXT), CAST(album_id AS TEXT) FROM spotify_song_album ORDER BY rowid")
+    _rebuild_table(conn, "spotify_song_artist",
+                   "(song_id TEXT NOT NULL, artist_id TEXT NOT NULL,"
+                   "PRIMARY KEY (song_id, artist_id),"
+                   "FOREIGN KEY (song_id) REFERENCES spotify_songs(sp_song_id),"
+                   "FOREIGN KEY (artist_id) REFERENCES spotify_artists(sp_artist_id))",
+                   "song_id, artist_id",
+                   "SELECT CAST(song_id AS TEXT), CAST(artist_id AS TEXT) FROM spotify_song_artist ORDER BY rowid")
+    _rebuild_table(conn, "spotify_playlist_songs",
+                   "(id INTEGER PRIMARY KEY AUTOINCREMENT, playlist_id TEXT NOT NULL, song_id TEXT NOT NULL, sequence INTEGER,"
+                   "FOREIGN KEY (playlist_id) REFERENCES spotify_playlists(sp_playlist_id),"
+                   "FOREIGN KEY (song_id) REFERENCES spotify_songs(sp_song_id),"
+                   "UNIQUE(playlist_id, song_id, sequence))",
+                   "id, playlist_id, song_id, sequence",
+                   "SELECT id, CAST(playlist_id AS TEXT), CAST(song_id AS TEXT), sequence "
+                   "FROM spotify_playlist_songs ORDER BY id")
+    _rebuild_table(conn, "youtube_playlist_songs",
+                   "(playlist_id TEXT NOT NULL, song_id TEXT NOT NULL,"
+                   "PRIMARY KEY (playlist_id, song_id),"
+                   "FOREIGN KEY (playlist_id) REFERENCES youtube_playlists(yt_playlist_id),"
+                   "FOREIGN KEY (song_id) REFERENCES youtube_songs(yt_song_id))",
+                   "playlist_id, song_id",
+                   "SELECT CAST(playlist_id AS TEXT), CAST(song_id AS TEXT) FROM youtube_playlist_songs ORDER BY rowid")
+    _rebuild_table(conn, "youtube_spotify_playlists",
+                   "(spotify_id TEXT NOT NULL, youtube_id TEXT NOT NULL, done INTEGER NOT NULL,"
+                   "PRIMARY KEY (spotify_id, youtube_id),"
+                   "FOREIGN KEY (spotify_id) REFERENCES spotify_playlists(sp_playlist_id),"
+                   "FOREIGN KEY (youtube_id) REFERENCES youtube_playlists(yt_playlist_id))",
+                   "spotify_id, youtube_id, done",
+                   "SELECT CAST(spotify_id AS TEXT), CAST(youtube_id AS TEXT), done "
+                   "FROM youtube_spotify_playlists ORDER BY rowid")
+    _rebuild_table(conn, "youtube_spotify_songs",
+                   "(spotify_id TEXT NOT NULL, youtube_id TEXT NOT NULL,"
+                   "PRIMARY KEY (spotify_id, youtube_id),"
+                   "FOREIGN KEY (spotify_id) REFERENCES spotify_songs(sp_song_id),"
+                   "FOREIGN KEY (youtube_id) REFERENCES youtube_songs(yt_song_id))",
+                   "spotify_id, youtube_id",
+                   "SELECT CAST(spotify_id AS TEXT), CAST(youtube_id AS TEXT) FROM youtube_spotify_songs ORDER BY rowid")
+
+
+def _hot_join_indexes(conn) -> None:
+    """Covering indexes for get_playlist_songs and artist lookups"""
+    c = conn.cursor()
+    c.execute("CREATE INDEX IF NOT EXISTS idx_playlist_songs_playlist "
+              "ON spotify_playlist_songs (playlist_id, sequence, id, song_id);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_song_artist_artist ON spotify_song_artist (artist_id, song_id);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_song_album_album ON spotify_song_album (album_id, song_id);")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_youtube_spotify_songs_youtube "
+              "ON youtube_spotify_songs (youtube_id, spotify_id);")
+
+
+def _transfer_checkpoints(conn) -> None:
+    """Track how far each Spotify -> YouTube playlist transfer has got"""
+    conn.execute("ALTER TABLE youtube_spotify_playlists ADD COLUMN added_offset INTEGER NOT NULL DEFAULT 0;")
+    # One YouTube playlist per Spotify playlist; nothing wrote this table before
+    conn.execute("DELETE FROM youtube_spotify_playlists WHERE rowid NOT IN "
+                 "(SELECT MIN(rowid) FROM youtube_spotify_playlists GROUP BY spotify_id);")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_youtube_spotify_playlists_spotify "
+                 "ON youtube_spotify_playlists (spotify_id);")
+
+
+def _playlist_snapshots(conn) -> None:
+    """Remember the Spotify snapshot_id each playlist was last synced at"""
+    conn.execute("ALTER TABLE spotify_playlists ADD COLUMN snapshot_id TEXT;")
+
+
+def _song_isrcs(conn) -> None:
+    """ISRCs let songs be matched by ID before falling back to text search"""
+    conn.execute("ALTER TABLE spotify_songs ADD COLUMN isrc TEXT;")
+
+
+def _refused_songs(conn) -> None:
+    """Videos YouTube Music refused to add, so transfers stop retrying them"""
+    conn.execute("CREATE TABLE IF NOT EXISTS youtube_refused_songs (yt_song_id TEXT PRIMARY KEY);")
+
+
+# (version, description, upgrade function); append new migrations at the end
+MIGRATIONS = [
+    (1, "baseline schema", _create_baseline),
+    (2, "TEXT keys and foreign keys on link tables", _text_keys),
+    (3, "indexes for hot joins", _hot_join_indexes),
+    (4, "transfer checkpoints", _transfer_checkpoints),
+    (5, "playlist snapshot ids", _playlist_snapshots),
+    (6, "song ISRCs", _song_isrcs),
+    (7, "refused videos", _refused_songs),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def is_current(conn) -> bool:
+    return get_version(conn) == LATEST_VERSION
+
+
+def migrate(conn) -> int:
+    """Upgrade the database in place and return the resulting version"""
+    version = get_version(conn)
+    if version == 0 and _table_exists(conn, "status"):
+        version = 1
+    if version > LATEST_VERSION:
+        raise sqlite3.DatabaseError(f"Database schema version {version} is newer than this code ({LATEST_VERSION})")
+
+    for target, description, upgrade in MIGRATIONS:
+        if target <= version:
+            continue
+        print(f"Migrating database to version {target}: {description}")
+        upgrade(conn)
+        conn.execute(f"PRAGMA user_version = {target}")
+        version = target
+    return version
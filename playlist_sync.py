@@ -0,0 +1,106 @@
+"""
+Diffing helpers for incremental playlist sync.
+
+Playlists are compared as ordered lists of IDs that may contain duplicates.
+Reordering is expressed as the fewest single-item moves: the items on a
+longest increasing subsequence of target positions stay where they are and
+everything else is moved in front of its successor.
+"""
+from collections import Counter, defaultdict
+from typing import Hashable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+
+class PlaylistDelta(NamedTuple):
+    added: List[str]  # in new-playlist order, one entry per added occurrence
+    removed: List[str]  # in old-playlist order, one entry per removed occurrence
+    moved: int  # kept items that change relative position
+
+    @property
+    def unchanged(self) -> bool:
+        return not (self.added or self.removed or self.moved)
+
+
+def longest_increasing_subsequence(values: Sequence[int]) -> Set[int]:
+    """Indices of one longest strictly increasing subsequence of `values`, in O(n log n)"""
+    tails = []  # tails[k]: index of the smallest tail of an increasing run of length k + 1
+    previous = [-1] * len(values)
+    for i, value in enumerate(values):
+        k = _bisect_tails(values, tails, value)
+        if k:
+            previous[i] = tails[k - 1]
+        if k == len(tails):
+            tails.append(i)
+        else:
+            tails[k] = i
+
+    keep = set()
+    i = tails[-1] if tails else -1
+    while i >= 0:
+        keep.add(i)
+        i = previous[i]
+    return keep
+
+
+def _bisect_tails(values: Sequence[int], tails: List[int], value: int) -> int:
+    """First k with values[tails[k]] >= value"""
+    lo, hi = 0, len(tails)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if values[tails[mid]] < value:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def target_positions(current: Sequence[Hashable], desired: Sequence[Hashable]) -> List[Optional[int]]:
+    """
+    Position in `desired` for each item of `current`, or None if it has no place there.
+
+    Duplicates are paired up in order, so the first occurrence in `current`
+    takes the first free occurrence in `desired`.
+    """
+    slots = defaultdict(list)
+    for position, item in enumerate(desired):
+        slots[item].append(position)
+    taken = Counter()
+    targets = []
+    for item in current:
+        if taken[item] < len(slots[item]):
+            targets.append(slots[item][taken[item]])
+            taken[item] += 1
+        else:
+            targets.append(None)
+    return targets
+
+
+def diff_tracks(old: Sequence[str], new: Sequence[str]) -> PlaylistDelta:
+    """Added, removed and moved tracks between two versions of a playlist"""
+    targets = target_positions(old, new)
+    removed = [item for item, target in zip(old, targets) if target is None]
+    kept = [target for target in targets if target is not None]
+    matched = set(kept)
+    added = [item for position, item in enumerate(new) if position not in matched]
+    return PlaylistDelta(added, removed, len(kept) - len(longest_increasing_subsequence(kept)))
+
+
+def plan_moves(current: Sequence[Hashable], desired: Sequence[Hashable]) -> List[Tuple[int, Optional[int]]]:
+    """
+    Moves that put `current` into the order of `desired`.
+
+    Both sequences must hold the same items. Returns (item, successor) pairs
+    of indices into `current`: move `item` directly before `successor`, or to
+    the end when successor is None. Apply them in the order given.
+    """
+    targets = target_positions(current, desired)
+    if None in targets or len(current) != len(desired):
+        raise ValueError("current and desired must contain the same items")
+
+    stays = {targets[i] for i in longest_increasing_subsequence(targets)}
+    by_target = {target: index for index, target in enumerate(targets)}
+    moves = []
+    # Walking backwards keeps every item after the current one in final order
+    for target in range(len(desired) - 1, -1, -1):
+        if target not in stays:
+            moves.append((by_target[target], by_target.get(target + 1)))
+    return moves
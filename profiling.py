@@ -0,0 +1,298 @@
+"""
+Profiling for a whole asyncio run, enabled with `python main.py --profile`.
+
+RunProfiler replaces asyncio.run and records, at the same time:
+
+- wall-clock versus CPU time per coroutine, through a task factory that
+  times every step of every task on the event loop thread;
+- time spent in blocking calls handed to worker threads (ytmusicapi calls,
+  SQLite reads via run_in_executor and jobs on the SQLite writer thread);
+- a sampled stack of every thread, written in the collapsed ("folded")
+  format read by flamegraph.pl, speedscope and similar tools;
+- cProfile statistics for the event loop thread.
+
+Output goes to <prefix>.txt (summary), <prefix>.folded and <prefix>.pstats.
+"""
+import asyncio
+import collections.abc
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Coroutine, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Leaf frames of threads that are only waiting for work, left out of the summary's hot list
+IDLE_FRAMES = {("threading.py", "wait"), ("selectors.py", "select"), ("queue.py", "get"), ("thread.py", "_worker")}
+
+
+class _Timing:
+    __slots__ = ("count", "wall", "cpu", "steps", "longest_step")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.steps = 0
+        self.longest_step = 0.0
+
+
+class TimedCoroutine(collections.abc.Coroutine):
+    """
+    Wraps a task's coroutine to time each step the event loop runs.
+
+    CPU time is the loop thread's CPU time during the steps; wall time runs
+    from the first step to completion, so it includes time spent waiting.
+    """
+
+    def __init__(self, coro: Coroutine, on_done: Callable[[str, float, float, int, float], None]) -> None:
+        self.coro = coro
+        self.on_done = on_done
+        self.__name__ = getattr(coro, "__name__", type(coro).__name__)
+        self.__qualname__ = getattr(coro, "__qualname__", self.__name__)
+        self.started = None
+        self.cpu = 0.0
+        self.steps = 0
+        self.longest_step = 0.0
+
+    def _step(self, method, *args):
+        start = time.perf_counter()
+        if self.started is None:
+            self.started = start
+        cpu = time.thread_time()
+        try:
+            return method(*args)
+        except BaseException:
+            # StopIteration included: the coroutine has finished
+            self._record(start, cpu)
+            self.on_done(self.__qualname__, time.perf_counter() - self.started, self.cpu,
+                         self.steps, self.longest_step)
+            raise
+        else:
+            self._record(start, cpu)
+
+    def _record(self, start: float, cpu: float) -> None:
+        self.cpu += time.thread_time() - cpu
+        self.steps += 1
+        self.longest_step = max(self.longest_step, time.perf_counter() - start)
+
+    def send(self, value):
+        return self._step(self.coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self.coro.throw, *args)
+
+    def close(self):
+        return self.coro.close()
+
+    def __await__(self):
+        return self.coro.__await__()
+
+    # Used by asyncio to format and inspect tasks
+    @property
+    def cr_frame(self):
+        return getattr(self.coro, "cr_frame", None)
+
+    @property
+    def cr_running(self):
+        return getattr(self.coro, "cr_running", False)
+
+    @property
+    def cr_await(self):
+        return getattr(self.coro, "cr_await", None)
+
+    @property
+    def cr_code(self):
+        return getattr(self.coro, "cr_code", None)
+
+
+def callable_name(func) -> str:
+    """module.qualname of a callable, looking through functools.partial"""
+    while isinstance(func, functools.partial):
+        func = func.func
+    module = getattr(func, "__module__", None) or ""
+    name = getattr(func, "__qualname__", None) or repr(func)
+    return f"{module}.{name}" if module else name
+
+
+def thread_group(name: str) -> str:
+    """Pool threads share a group, e.g. ytmusic_3 -> ytmusic"""
+    return re.sub(r"[_-]\d+$", "", name)
+
+
+class RunProfiler:
+    """
+    Profile one asyncio run end to end.
+
+    Usage:
+        RunProfiler("profile").run(main())
+    """
+
+    def __init__(self, prefix: str = "profile", interval: float = 0.005, top: int = 25) -> None:
+        self.prefix = prefix
+        self.interval = interval
+        self.top = top
+        self.lock = threading.Lock()
+        self.coroutines: Dict[str, _Timing] = defaultdict(_Timing)
+        self.blocking: Dict[str, _Timing] = defaultdict(_Timing)
+        self.samples = Counter()
+        self.sample_count = 0
+        self.stopped = threading.Event()
+        self.sampler = None
+        self.cprofile = cProfile.Profile()
+        self.wall = self.cpu = 0.0
+
+    # Coroutines
+
+    def _coroutine_done(self, name: str, wall: float, cpu: float, steps: int, longest_step: float) -> None:
+        timing = self.coroutines[name]
+        timing.count += 1
+        timing.wall += wall
+        timing.cpu += cpu
+        timing.steps += steps
+        timing.longest_step = max(timing.longest_step, longest_step)
+
+    def _task_factory(self, loop, coro, **kwargs):
+        return asyncio.Task(TimedCoroutine(coro, self._coroutine_done), loop=loop, **kwargs)
+
+    # Blocking calls on worker threads
+
+    def _timed_call(self, func, name: str):
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            start, cpu = time.perf_counter(), time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                wall = time.perf_counter() - start
+                with self.lock:
+                    timing = self.blocking[name]
+                    timing.count += 1
+                    timing.wall += wall
+                    timing.cpu += time.thread_time() - cpu
+                    timing.longest_step = max(timing.longest_step, wall)
+        return call
+
+    def _patch_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        loop.set_task_factory(self._task_factory)
+        run_in_executor = loop.run_in_executor
+
+        def timed_run_in_executor(executor, func, *args):
+            return run_in_executor(executor, self._timed_call(func, callable_name(func)), *args)
+
+        loop.run_in_executor = timed_run_in_executor
+
+    def _patch_sqlite_writer(self):
+        """Time jobs on the SQLite writer thread; returns a function undoing the patch"""
+        from database import SQLiteConnectionPool
+
+        submit = SQLiteConnectionPool.submit
+
+        def timed_submit(pool, job):
+            return submit(pool, self._timed_call(job, f"sqlite write: {callable_name(job)}"))
+
+        SQLiteConnectionPool.submit = timed_submit
+        return lambda: setattr(SQLiteConnectionPool, "submit", submit)
+
+    # Stack sampling
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(thread_group(names.get(ident, str(ident))))
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    # Running
+
+    def run(self, main: Coroutine):
+        """Run `main` like asyncio.run, profiling it, then write the reports"""
+        async def profiled():
+            self._patch_loop(asyncio.get_running_loop())
+            return await main
+
+        unpatch = self._patch_sqlite_writer()
+        self.sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self.sampler.start()
+        start, cpu = time.perf_counter(), time.process_time()
+        self.cprofile.enable()
+        try:
+            return asyncio.run(TimedCoroutine(profiled(), self._coroutine_done))
+        finally:
+            self.cprofile.disable()
+            self.wall, self.cpu = time.perf_counter() - start, time.process_time() - cpu
+            self.stopped.set()
+            self.sampler.join()
+            unpatch()
+            for path in self.write():
+                logger.info(f"Wrote profile to {path}")
+
+    # Reports
+
+    def folded(self) -> str:
+        """Sampled stacks in collapsed format: `thread;outer;...;leaf count` per line"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.samples.items()))
+
+    @staticmethod
+    def _table(title: str, timings: Dict[str, _Timing], top: int, cpu_note: str) -> List[str]:
+        lines = [title, f"  {'wall s':>9} {'cpu s':>9} {'cpu %':>6} {'count':>7} {'longest s':>10}  name"]
+        for name, timing in sorted(timings.items(), key=lambda item: item[1].wall, reverse=True)[:top]:
+            share = timing.cpu / timing.wall if timing.wall else 0.0
+            lines.append(f"  {timing.wall:9.3f} {timing.cpu:9.3f} {share:6.1%} {timing.count:7d} "
+                         f"{timing.longest_step:10.3f}  {name}")
+        lines.append(f"  ({cpu_note})")
+        return lines + [""]
+
+    def summary(self) -> str:
+        lines = [f"Run: {self.wall:.3f}s wall, {self.cpu:.3f}s CPU (all threads), "
+                 f"{self.sample_count} stack samples every {self.interval * 1000:.0f} ms", ""]
+        lines += self._table("Coroutines (tasks), by total wall time", self.coroutines, self.top,
+                             "cpu is event loop thread time; longest is the longest single step, "
+                             "i.e. the longest the task kept the loop busy")
+        lines += self._table("Blocking calls on worker threads, by total wall time", self.blocking, self.top,
+                             "wall is time the calling coroutine waited, excluding queueing for a thread")
+
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            frames = stack.split(";")
+            if len(frames) > 1 and tuple(frames[-1].split(":", 1)) not in IDLE_FRAMES:
+                leaves[f"{frames[0]}: {frames[-1]}"] += count
+        busy = sum(leaves.values())
+        lines.append("Hottest sampled frames (self time, idle waits excluded)")
+        for leaf, count in leaves.most_common(self.top):
+            lines.append(f"  {count:7d} {count / busy:6.1%}  {leaf}")
+        lines.append("")
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self.cprofile, stream=stream)
+        stats.sort_stats("tottime").print_stats(self.top)
+        lines.append("Hottest functions on the event loop thread (cProfile, by own time)")
+        lines.append(stream.getvalue().strip())
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> List[str]:
+        """Write <prefix>.txt, <prefix>.folded and <prefix>.pstats and return their paths"""
+        paths = [f"{self.prefix}.txt", f"{self.prefix}.folded", f"{self.prefix}.pstats"]
+        with open(paths[0], "w") as file:
+            file.write(self.summary())
+        with open(paths[1], "w") as file:
+            file.write(self.folded())
+        self.cprofile.dump_stats(paths[2])
+        return paths
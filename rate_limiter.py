@@ -0,0 +1,232 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from metrics import API_REQUESTS, API_RETRIES, API_SECONDS, SLEEP_SECONDS
+
+
+class TokenBucket:
+    """Token bucket whose refill rate can be changed while it is in use"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> float:
+        """Take one token, sleeping until one is available. Returns the time slept."""
+        waited = 0.0
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class EndpointLimiter:
+    """Token bucket plus an AIMD-controlled concurrency limit for one endpoint"""
+
+    def __init__(self, name: str, rate: float, burst: float, concurrency: int,
+                 min_rate: float, max_rate: float, max_concurrency: int,
+                 rate_step: float, decrease_factor: float, latency_tolerance: float) -> None:
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.concurrency = float(concurrency)
+        self.max_concurrency = max_concurrency
+        self.rate_step = rate_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.baseline_latency: Optional[float] = None
+        self.latency_ewma: Optional[float] = None
+        self.successes = 0
+        self.failures = 0
+        self.wait_time = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    async def acquire(self) -> float:
+        """Take a concurrency slot and a token; returns the time slept waiting for the token"""
+        async with self.condition:
+            while self.in_flight >= int(self.concurrency):
+                await self.condition.wait()
+            self.in_flight += 1
+        try:
+            waited = await self.bucket.acquire()
+        except BaseException:
+            # Cancelled while waiting for a token: give the slot back, even if cancelled again
+            await asyncio.shield(self.release())
+            raise
+        self.wait_time += waited
+        return waited
+
+    async def release(self) -> None:
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def _increase(self) -> None:
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + self.rate_step)
+        # Roughly one extra slot per window of successful calls
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+    def _decrease(self) -> None:
+        self.bucket.rate = max(self.min_rate, self.bucket.rate * self.decrease_factor)
+        self.concurrency = max(1.0, self.concurrency * self.decrease_factor)
+
+    def record_success(self, latency: float) -> None:
+        self.successes += 1
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+            self.baseline_latency = latency
+        else:
+            self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+            self.baseline_latency = min(self.baseline_latency, self.latency_ewma)
+
+        if self.latency_ewma > self.baseline_latency * self.latency_tolerance:
+            self._decrease()
+            # Re-anchor so a single slow period does not keep halving the rate
+            self.baseline_latency = self.latency_ewma
+        else:
+            self._increase()
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._decrease()
+
+    def snapshot(self) -> Dict:
+        return {
+            "rate": round(self.bucket.rate, 3),
+            "concurrency": int(self.concurrency),
+            "in_flight": self.in_flight,
+            "latency": round(self.latency_ewma or 0.0, 3),
+            "successes": self.successes,
+            "failures": self.failures,
+            "wait_time": round(self.wait_time, 3),
+        }
+
+
+class RateGovernor:
+    """
+    Shared rate limiter for all calls to an external API.
+
+    Each endpoint gets its own token bucket and concurrency limit. Both follow
+    AIMD: they grow additively while calls succeed at a steady latency and are
+    cut multiplicatively on errors or when latency climbs above the baseline.
+
+    Usage:
+        async with governor.limit("search"):
+            ...
+
+    Calls, their latency, backoff and pacing sleeps are recorded in
+    metrics.REGISTRY under `service`.
+    """
+
+    def __init__(self, rate: float = 2.0, burst: float = 5.0, concurrency: int = 4,
+                 min_rate: float = 0.2, max_rate: float = 20.0, max_concurrency: int = 16,
+                 rate_step: float = 0.1, decrease_factor: float = 0.5, latency_tolerance: float = 2.0,
+                 base_backoff: float = 1.0, max_backoff: float = 60.0,
+                 endpoints: Optional[Dict[str, Dict]] = None, service: str = "ytmusic") -> None:
+        self.service = service
+        self.defaults = {
+            "rate": rate,
+            "burst": burst,
+            "concurrency": concurrency,
+            "min_rate": min_rate,
+            "max_rate": max_rate,
+            "max_concurrency": max_concurrency,
+            "rate_step": rate_step,
+            "decrease_factor": decrease_factor,
+            "latency_tolerance": latency_tolerance,
+        }
+        self.endpoint_config = endpoints or {}
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.limiters: Dict[str, EndpointLimiter] = {}
+
+    def limiter(self, endpoint: str) -> EndpointLimiter:
+        if endpoint not in self.limiters:
+            config = {**self.defaults, **self.endpoint_config.get(endpoint, {})}
+            self.limiters[endpoint] = EndpointLimiter(endpoint, **config)
+        return self.limiters[endpoint]
+
+    @asynccontextmanager
+    async def limit(self, endpoint: str):
+        limiter = self.limiter(endpoint)
+        waited = await limiter.acquire()
+        if waited:
+            SLEEP_SECONDS.inc(waited, service=self.service, reason="pacing")
+        start = time.monotonic()
+        try:
+            yield
+        except Exception:
+            limiter.record_failure()
+            API_REQUESTS.inc(service=self.service, endpoint=endpoint, outcome="error")
+            raise
+        else:
+            limiter.record_success(time.monotonic() - start)
+            API_REQUESTS.inc(service=self.service, endpoint=endpoint, outcome="ok")
+        finally:
+            API_SECONDS.observe(time.monotonic() - start, service=self.service, endpoint=endpoint)
+            await limiter.release()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter for the given retry attempt (0-based)"""
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    async def backoff(self, endpoint: str, attempt: int) -> float:
+        delay = self.backoff_delay(attempt)
+        self.limiter(endpoint).wait_time += delay
+        API_RETRIES.inc(service=self.service, endpoint=endpoint, reason="error")
+        SLEEP_SECONDS.inc(delay, service=self.service, reason="backoff")
+        await asyncio.sleep(delay)
+        return delay
+
+    def current_rate(self, endpoint: str) -> float:
+        return self.limiter(endpoint).rate
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: limiter.snapshot() for name, limiter in self.limiters.items()}
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size tuned at runtime: additive growth while calls succeed,
+    multiplicative shrink on errors, always within [minimum, maximum].
+    """
+
+    def __init__(self, initial: int = 25, minimum: int = 1, maximum: int = 100,
+                 step: int = 5, decrease_factor: float = 0.5) -> None:
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.step = step
+        self.decrease_factor = decrease_factor
+        self.current = float(min(self.maximum, max(self.minimum, initial)))
+
+    @property
+    def size(self) -> int:
+        return int(self.current)
+
+    def record_success(self) -> None:
+        self.current = min(self.maximum, self.current + self.step)
+
+    def record_failure(self) -> None:
+        self.current = max(self.minimum, self.current * self.decrease_factor)
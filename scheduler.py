@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Job(NamedTuple):
+    key: str
+    size: int  # smaller jobs are started first
+    run: Callable[[], Awaitable[Any]]
+
+
+class JobResult(NamedTuple):
+    key: str
+    ok: bool
+    value: Any
+    error: Optional[Exception]
+    elapsed: float
+
+
+class Scheduler:
+    """
+    Runs jobs concurrently under a fixed concurrency budget.
+
+    At most `concurrency` jobs run at a time and a job's coroutine is only
+    created when a slot frees up, so the number of playlists in flight stays
+    bounded however many are selected. Jobs start smallest first, which
+    finishes many playlists early. A job that raises is logged and reported
+    in its JobResult; the others keep running.
+    """
+
+    def __init__(self, concurrency: int = 4, name: str = "jobs") -> None:
+        self.concurrency = max(1, concurrency)
+        self.name = name
+
+    async def _run_job(self, job: Job) -> JobResult:
+        start = time.monotonic()
+        try:
+            value = await job.run()
+        except Exception as e:
+            logger.error(f"{self.name}: {job.key} failed: {e}")
+            return JobResult(job.key, False, None, e, time.monotonic() - start)
+        return JobResult(job.key, True, value, None, time.monotonic() - start)
+
+    async def run(self, jobs: Iterable[Job]) -> List[JobResult]:
+        """Run every job and return their results, smallest job first"""
+        ordered = sorted(jobs, key=lambda job: job.size)
+        results: List[Optional[JobResult]] = [None] * len(ordered)
+        queue = iter(enumerate(ordered))
+        finished = 0
+
+        async def worker() -> None:
+            nonlocal finished
+            # Workers share one iterator, so each job is taken exactly once
+            for index, job in queue:
+                results[index] = await self._run_job(job)
+                finished += 1
+                logger.info(f"{self.name}: {finished}/{len(ordered)} done ({job.key} in {results[index].elapsed:.1f}s)")
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(min(self.concurrency, len(ordered)))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            raise
+
+        failed = [result.key for result in results if not result.ok]
+        if failed:
+            logger.warning(f"{self.name}: {len(failed)} of {len(ordered)} failed: {failed}")
+        return results
@@ -0,0 +1,111 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from metrics import CACHE_LOOKUPS
+
+
+class SearchCache:
+    """
+    Persistent cache of raw YouTube Music search results.
+
+    Entries are keyed by the normalized search query and expire after `ttl`
+    seconds. When the cache grows past `max_entries`, the least recently used
+    entries are evicted.
+    """
+
+    def __init__(self, user_id: str, ttl: int = 30 * 24 * 3600, max_entries: int = 50000) -> None:
+        self.db_file = f"{user_id}_search_cache.db"
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS search_results"
+                                "(query TEXT PRIMARY KEY, results TEXT NOT NULL, "
+                                "created_at REAL NOT NULL, accessed_at REAL NOT NULL);")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_search_results_accessed "
+                                "ON search_results (accessed_at);")
+        self.connection.commit()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    @staticmethod
+    def slim_results(results: List[dict]) -> List[dict]:
+        """Keep only the fields used for scoring and playlist building"""
+        return [
+            {
+                "videoId": r.get("videoId"),
+                "title": r.get("title") or "",
+                "artists": [{"name": a.get("name") or ""} for a in (r.get("artists") or [])],
+            }
+            for r in results
+            if r.get("videoId")
+        ]
+
+    def get(self, query: str) -> Optional[List[dict]]:
+        key = self.normalize_query(query)
+        now = time.time()
+        try:
+            with self.lock:
+                row = self.connection.execute(
+                    "SELECT results, created_at FROM search_results WHERE query = ?", (key,)
+                ).fetchone()
+                if not row:
+                    CACHE_LOOKUPS.inc(cache="search", result="miss")
+                    return None
+                if now - row[1] > self.ttl:
+                    self.connection.execute("DELETE FROM search_results WHERE query = ?", (key,))
+                    self.connection.commit()
+                    CACHE_LOOKUPS.inc(cache="search", result="expired")
+                    return None
+                self.connection.execute("UPDATE search_results SET accessed_at = ? WHERE query = ?", (now, key))
+                self.connection.commit()
+            CACHE_LOOKUPS.inc(cache="search", result="hit")
+            return json.loads(row[0])
+        except sqlite3.Error as e:
+            print(f"Error reading search cache: {e}")
+            return None
+
+    def put(self, query: str, results: List[dict]) -> None:
+        key = self.normalize_query(query)
+        now = time.time()
+        try:
+            with self.lock:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO search_results (query, results, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(self.slim_results(results)), now, now)
+                )
+                self._evict()
+                self.connection.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing search cache: {e}")
+
+    def _evict(self) -> None:
+        count = self.connection.execute("SELECT COUNT(*) FROM search_results").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        self.connection.execute(
+            "DELETE FROM search_results WHERE query IN "
+            "(SELECT query FROM search_results ORDER BY accessed_at ASC LIMIT ?)",
+            (count - self.max_entries,)
+        )
+
+    def purge_expired(self) -> None:
+        try:
+            with self.lock:
+                self.connection.execute("DELETE FROM search_results WHERE created_at < ?",
+                                        (time.time() - self.ttl,))
+                self.connection.commit()
+        except sqlite3.Error as e:
+            print(f"Error purging search cache: {e}")
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
@@ -1,48 +1,307 @@
+import asyncio
+import itertools
+import logging
 import os
+import random
+import re
 import time
+from collections import deque
+from typing import AsyncIterator, List, NamedTuple, Optional, Tuple
 import httpx
 from dotenv import load_dotenv
 
+from metrics import API_REQUESTS, API_RETRIES, API_SECONDS, SLEEP_SECONDS
+
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Only the track fields the database stores; available_markets and images dominate full payloads
+PLAYLIST_TRACK_FIELDS = ("items(track(id,name,external_ids(isrc),album(id,name,release_date),artists(id,name))),"
+                         "next,total,limit,offset")
+
+_ID_SEGMENT = re.compile(r"/(playlists|users|albums|artists|tracks)/[^/]+")
+
+
+def endpoint_label(url) -> str:
+    """Metric label for a request URL: its path with IDs replaced, e.g. /v1/playlists/{id}/tracks"""
+    return _ID_SEGMENT.sub(r"/\1/{id}", httpx.URL(str(url)).path)
+
+
+class SpotifyTrack(NamedTuple):
+    id: str
+    name: str
+    album_id: str
+    album_name: str
+    album_release_date: str
+    artists: Tuple[Tuple[str, str], ...]  # (artist_id, artist_name) pairs
+    isrc: Optional[str] = None
+
+    @classmethod
+    def from_item(cls, item: dict) -> Optional["SpotifyTrack"]:
+        """Decode a playlist item, skipping local files and removed tracks"""
+        track = item.get("track")
+        if not track or not track.get("id"):
+            return None
+        album = track.get("album") or {}
+        return cls(
+            track["id"],
+            track["name"],
+            album.get("id"),
+            album.get("name"),
+            album.get("release_date"),
+            tuple((a["id"], a["name"]) for a in track.get("artists") or [] if a.get("id")),
+            (track.get("external_ids") or {}).get("isrc"),
+        )
 
 
 class spotify_user:
-    def __init__(self, code: str) -> None:
-        r = httpx.post("https://accounts.spotify.com/api/token",
-                       data={"grant_type": "authorization_code",
-                             "code": code,
-                             "redirect_uri": "http://localhost:6969/callback",
-                             "client_id": os.getenv("client_id"),
-                             "client_secret": os.getenv("client_secret")})
-        self.token_expiry = time.time() + r.json()["expires_in"]
-        self.access_token = r.json()["access_token"]
-        self.refresh_token = r.json()["refresh_token"]
-
-        r = httpx.get("https://api.spotify.com/v1/me", headers={"Authorization": f"Bearer {self.access_token}"})
-        self.id = r.json()["id"]
+    """
+    Spotify Web API client for one authorised user.
+
+    All traffic, including the token exchange, goes through a single pooled
+    keep-alive client. Use `await spotify_user.create(code)` or
+    `async with spotify_user(code) as user:` and close it when done.
+    """
+
+    def __init__(self, code: str, max_connections: int = 20, max_keepalive_connections: int = 10,
+                 http2: bool = True, timeout: float = 30.0, page_concurrency: int = 8,
+                 max_retries: int = 5, max_throttle_retries: int = 10, refresh_margin: float = 300.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None) -> None:
+        self.code = code
+        self.page_concurrency = max(1, page_concurrency)
+        self.max_retries = max_retries
+        self.max_throttle_retries = max_throttle_retries
+        # Refresh this many seconds before the access token expires
+        self.refresh_margin = refresh_margin
+        self.id = None
+        self.access_token = None
+        self.refresh_token = None
+        self.token_expiry = 0.0
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_keepalive_connections),
+            # e.g. httpx.MockTransport to run against a local fake of the API
+            transport=transport,
+        )
+        self.refresh_lock = asyncio.Lock()
+        self.refresh_task = None
+        # monotonic time until which every request waits after a 429
+        self.paused_until = 0.0
+        self.stats = {"requests": 0, "retries": 0, "throttled": 0, "throttle_wait": 0.0,
+                      "backoff_wait": 0.0, "token_refreshes": 0}
+
+    @classmethod
+    async def create(cls, code: str, **kwargs) -> "spotify_user":
+        user = cls(code, **kwargs)
+        try:
+            await user.login()
+        except Exception:
+            await user.close()
+            raise
+        return user
+
+    async def _token_request(self, data: dict) -> None:
+        with API_SECONDS.time(service="spotify", endpoint="/api/token"):
+            r = await self.client.post("https://accounts.spotify.com/api/token",
+                                       data={**data,
+                                             "client_id": os.getenv("client_id"),
+                                             "client_secret": os.getenv("client_secret")})
+        API_REQUESTS.inc(service="spotify", endpoint="/api/token", outcome=r.status_code)
+        r.raise_for_status()
+        token = r.json()
+        self.token_expiry = time.time() + token["expires_in"]
+        self.access_token = token["access_token"]
+        # Spotify only sometimes rotates the refresh token
+        self.refresh_token = token.get("refresh_token", self.refresh_token)
+
+    async def login(self) -> None:
+        await self._token_request({"grant_type": "authorization_code",
+                                   "code": self.code,
+                                   "redirect_uri": "http://localhost:6969/callback"})
+        self.refresh_task = asyncio.create_task(self._refresh_loop())
+
+        me = await self.async_fetch("https://api.spotify.com/v1/me")
+        self.id = me["id"]
+
+    async def refresh(self) -> None:
+        async with self.refresh_lock:
+            # Another request may have refreshed while we waited for the lock
+            if time.time() < self.token_expiry - self.refresh_margin:
+                return
+            await self._token_request({"grant_type": "refresh_token",
+                                       "refresh_token": self.refresh_token})
+            self.stats["token_refreshes"] += 1
+            logger.info("Refreshed Spotify access token")
+
+    async def _refresh_loop(self) -> None:
+        """Refresh the access token in the background shortly before it expires"""
+        while True:
+            await asyncio.sleep(max(0.0, self.token_expiry - self.refresh_margin - time.time()))
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Background token refresh failed: {e}")
+                SLEEP_SECONDS.inc(30, service="spotify", reason="refresh_retry")
+                await asyncio.sleep(30)
+
+    async def check_token(self) -> None:
+        if time.time() >= self.token_expiry - self.refresh_margin:
+            await self.refresh()
+
+    async def close(self) -> None:
+        if self.refresh_task:
+            self.refresh_task.cancel()
+        await self.client.aclose()
+
+    async def __aenter__(self) -> "spotify_user":
+        if self.access_token is None:
+            await self.login()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+
+    async def _wait_if_paused(self) -> None:
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            self.stats["throttle_wait"] += delay
+            SLEEP_SECONDS.inc(delay, service="spotify", reason="throttle")
+            await asyncio.sleep(delay)
+
+    async def _backoff(self, attempt: int) -> None:
+        delay = random.uniform(0, min(30.0, 2 ** attempt))
+        self.stats["retries"] += 1
+        self.stats["backoff_wait"] += delay
+        SLEEP_SECONDS.inc(delay, service="spotify", reason="backoff")
+        await asyncio.sleep(delay)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send an authorised request.
+
+        429 responses pause every in-flight request for the Retry-After period,
+        5xx responses and transport errors are retried with jittered backoff and
+        a 401 triggers a token refresh. Other errors raise httpx.HTTPStatusError.
+        """
+        attempts = throttles = 0
+        refreshed = False
+        endpoint = endpoint_label(url)
+        while True:
+            await self._wait_if_paused()
+            await self.check_token()
+            self.stats["requests"] += 1
+            try:
+                with API_SECONDS.time(service="spotify", endpoint=endpoint):
+                    response = await self.client.request(
+                        method, url, headers={"Authorization": f"Bearer {self.access_token}"}, **kwargs)
+            except httpx.TransportError as e:
+                API_REQUESTS.inc(service="spotify", endpoint=endpoint, outcome="transport_error")
+                if attempts >= self.max_retries:
+                    raise
+                logger.warning(f"Retrying {url} after error: {e}")
+                API_RETRIES.inc(service="spotify", endpoint=endpoint, reason="error")
+                await self._backoff(attempts)
+                attempts += 1
+                continue
+
+            API_REQUESTS.inc(service="spotify", endpoint=endpoint, outcome=response.status_code)
+            if response.status_code == 429 and throttles < self.max_throttle_retries:
+                try:
+                    retry_after = float(response.headers.get("Retry-After", 1))
+                except ValueError:
+                    retry_after = 1.0
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                self.stats["throttled"] += 1
+                throttles += 1
+                API_RETRIES.inc(service="spotify", endpoint=endpoint, reason="throttled")
+                logger.warning(f"Rate limited by Spotify, pausing requests for {retry_after}s")
+                continue
+
+            if response.status_code == 401 and not refreshed:
+                self.token_expiry = 0.0
+                refreshed = True
+                API_RETRIES.inc(service="spotify", endpoint=endpoint, reason="unauthorized")
+                continue
+
+            if response.status_code >= 500 and attempts < self.max_retries:
+                logger.warning(f"Retrying {url} after status {response.status_code}")
+                API_RETRIES.inc(service="spotify", endpoint=endpoint, reason="error")
+                await self._backoff(attempts)
+                attempts += 1
+                continue
+
+            response.raise_for_status()
+            return response
 
     async def async_fetch(self, url: str) -> dict:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers={"Authorization": f"Bearer {self.access_token}"})
-            return response.json()
+        response = await self.request("GET", url)
+        return response.json()
 
-    async def get_all_pages(self, initial_url: str) -> list:
-        results = []
-        next_url = initial_url
+    async def iter_pages(self, initial_url: str, parallel: bool = True) -> AsyncIterator[list]:
+        """
+        Yield the items of a paged endpoint one page at a time, in order.
+
+        In parallel mode the first page's `total` and `limit` are used to request
+        the remaining offsets directly, keeping at most `page_concurrency` pages
+        in flight. Endpoints that are not offset-paged fall back to following
+        the `next` links.
+        """
+        first = await self.async_fetch(initial_url)
+        yield first["items"]
+
+        next_url = first.get("next")
+        total, limit = first.get("total"), first.get("limit")
+        if not next_url:
+            return
 
-        while next_url:
-            response = await self.async_fetch(next_url)
-            results.extend(response["items"])
-            next_url = response["next"]
+        if not parallel or not total or not limit:
+            while next_url:
+                page = await self.async_fetch(next_url)
+                yield page["items"]
+                next_url = page["next"]
+            return
 
+        # Offsets are merged into the caller's URL, not the cursor in `next`, whose shape may change
+        url = httpx.URL(initial_url)
+        offsets = iter(range(first.get("offset", 0) + limit, total, limit))
+        pending = deque()
+
+        def schedule() -> None:
+            for offset in itertools.islice(offsets, self.page_concurrency - len(pending)):
+                page_url = str(url.copy_merge_params({"offset": offset, "limit": limit}))
+                pending.append(asyncio.ensure_future(self.async_fetch(page_url)))
+
+        try:
+            schedule()
+            while pending:
+                page = await pending.popleft()
+                schedule()
+                yield page["items"]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def get_all_pages(self, initial_url: str, parallel: bool = True) -> list:
+        """Fetch every item of a paged endpoint; see iter_pages"""
+        results = []
+        async for items in self.iter_pages(initial_url, parallel):
+            results.extend(items)
         return results
 
-    async def get_playlists(self) -> list:
-        return await self.get_all_pages("https://api.spotify.com/v1/me/playlists")
+    async def get_playlists(self, parallel: bool = True) -> list:
+        return await self.get_all_pages("https://api.spotify.com/v1/me/playlists?limit=50", parallel)
 
-    async def get_playlist_songs(self, playlist_id: str) -> list:
-        return await self.get_all_pages(f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks")
+    async def iter_playlist_songs(self, playlist_id: str, parallel: bool = True) -> AsyncIterator[List[SpotifyTrack]]:
+        """Yield a playlist's tracks page by page as lean SpotifyTrack records"""
+        url = httpx.URL(f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
+                        params={"limit": 100, "fields": PLAYLIST_TRACK_FIELDS})
+        async for items in self.iter_pages(str(url), parallel):
+            yield [track for track in map(SpotifyTrack.from_item, items) if track]
 
-    def check_token(self) -> None:
-        if time.time() >= self.token_expiry:
-            self.refresh()
+    async def get_playlist_songs(self, playlist_id: str, parallel: bool = True) -> List[SpotifyTrack]:
+        songs = []
+        async for tracks in self.iter_playlist_songs(playlist_id, parallel):
+            songs.extend(tracks)
+        return songs
@@ -1,22 +1,81 @@
 import asyncio
-from typing import List, Tuple, Dict, Optional
+import functools
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Tuple, Dict, Optional
 from ytmusicapi import YTMusic, setup
-from difflib import SequenceMatcher
-from youtube_auth import capture_headers
+from rate_limiter import AdaptiveBatchSize, RateGovernor
+from search_cache import SearchCache
+from match_store import GlobalMatchStore
+from metrics import SONGS
+from matching import DEFAULT_POLICY, ScoringPolicy, best_match, normalize, prepare_query, similarity
+from playlist_sync import plan_moves, target_positions
 import logging
 import re
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+class PlaylistEditError(Exception):
+    """YouTube Music answered a playlist edit with a status other than STATUS_SUCCEEDED"""
+
+
+def check_status(response, action: str) -> None:
+    """
+    Raise PlaylistEditError unless a playlist edit response reports success.
+
+    ytmusicapi does not raise on a rejected edit: it returns the response,
+    a dict or a bare status string, whatever the outcome.
+    """
+    status = response.get("status", "") if isinstance(response, dict) else response
+    if not isinstance(status, str) or "SUCCEEDED" not in status:
+        raise PlaylistEditError(f"{action} failed: {status or response!r}")
+
+
 class YouTubeManager:
-    def __init__(self, db, batch_size: int = 5, max_retries: int = 3, retry_delay: int = 5):
+    def __init__(self, db, batch_size: int = 5, max_retries: int = 3, retry_delay: int = 5,
+                 search_concurrency: int = 8, governor: Optional[RateGovernor] = None,
+                 search_cache: Optional[SearchCache] = None, similarity_threshold: float = 0.6,
+                 match_store: Optional[GlobalMatchStore] = None,
+                 add_batch_size: int = 25, max_add_batch_size: int = 100,
+                 scoring_policy: Optional[ScoringPolicy] = None, isrc_title_guard: float = 0.5,
+                 ytmusic: Optional[YTMusic] = None):
         self.db = db
-        self.yt = YTMusic()
-        self.authenticated_yt = None
+        # An injected client (e.g. the benchmark's fake) serves both anonymous and authenticated calls
+        self.yt = ytmusic or YTMusic()
+        self.authenticated_yt = ytmusic
+        # Progress/persistence granularity for searches; adds use self.add_batch
         self.batch_size = batch_size
+        self.add_batch = AdaptiveBatchSize(initial=add_batch_size, maximum=max_add_batch_size)
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.search_concurrency = max(1, search_concurrency)
+        # Every YouTube Music call is paced by this governor; see self.governor.stats()
+        self.governor = governor or RateGovernor(base_backoff=retry_delay)
+        # Raw candidates are cached so a changed threshold re-scores locally
+        self.search_cache = search_cache
+        self.similarity_threshold = similarity_threshold
+        # See matching.py; LegacyPolicy restores the old SequenceMatcher scores
+        self.scoring_policy = scoring_policy or DEFAULT_POLICY
+        # Minimum title similarity for trusting the top result of an ISRC search
+        self.isrc_title_guard = isrc_title_guard
+        # Optional store shared with other users; consulted before searching
+        self.match_store = match_store
+        # ytmusicapi is synchronous, so its calls run here instead of on the event loop
+        self.executor = ThreadPoolExecutor(max_workers=self.search_concurrency,
+                                           thread_name_prefix="ytmusic")
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Run a blocking ytmusicapi call in the thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def close(self) -> None:
+        """Shut down the worker threads used for ytmusicapi calls"""
+        self.executor.shutdown(wait=False)
+        if self.search_cache:
+            self.search_cache.close()
 
     def authenticate(self, oauth_file: str = "browser.json") -> None:
         """Initialize authenticated YouTube Music instance"""
@@ -29,6 +88,8 @@ class YouTubeManager:
 
 
     async def setup(self):
+         # Only needed for the interactive browser login
+         from youtube_auth import capture_headers
          await capture_headers()
          with open("headers.txt", "r") as file:
             headers = file.read()
@@ -64,11 +125,13 @@ class YouTubeManager:
                 logger.error("Invalid playlist name after sanitization")
                 return None
 
-            playlist_id = self.authenticated_yt.create_playlist(
-                title=sanitized_name,
-                description=sanitized_description,
-                privacy_status="UNLISTED"
-            )
+            async with self.governor.limit("create_playlist"):
+                playlist_id = await self._run_blocking(
+                    self.authenticated_yt.create_playlist,
+                    title=sanitized_name,
+                    description=sanitized_description,
+                    privacy_status="UNLISTED"
+                )
             
             logger.info(f"Successfully created playlist: {sanitized_name}")
             return playlist_id
@@ -76,12 +139,33 @@ class YouTubeManager:
         except Exception as e:
             if retry_count < self.max_retries:
                 logger.warning(f"Retrying playlist creation for {name} after error: {e}")
-                await asyncio.sleep(self.retry_delay * (retry_count + 1))
+                await self.governor.backoff("create_playlist", retry_count)
                 return await self.create_playlist(name, description, retry_count + 1)
             
             logger.error(f"Failed to create playlist {name}: {e}")
             return None
 
+    async def _edit_playlist_call(self, endpoint: str, func, *args, retry_count: int = 0, **kwargs):
+        """
+        Make a playlist edit under the governor, retrying errors with backoff.
+
+        The response must report success (see check_status); a rejection
+        raises PlaylistEditError straight away, since a retry would be
+        rejected too. Other errors are raised once max_retries is used up.
+        """
+        try:
+            async with self.governor.limit(endpoint):
+                response = await self._run_blocking(func, *args, **kwargs)
+        except Exception as e:
+            if retry_count >= self.max_retries:
+                raise
+            logger.warning(f"Retrying {endpoint} after error: {e}")
+            await self.governor.backoff(endpoint, retry_count)
+            return await self._edit_playlist_call(endpoint, func, *args, retry_count=retry_count + 1, **kwargs)
+        # Checked outside the governor: a rejected edit says nothing about load
+        check_status(response, endpoint)
+        return response
+
     async def add_songs_to_playlist(self, playlist_id: str, song_ids: List[str], 
                                   retry_count: int = 0) -> bool:
         """Add songs to a playlist with retry logic"""
@@ -95,91 +179,400 @@ class YouTubeManager:
             if not valid_song_ids:
                 return False
 
-            self.authenticated_yt.add_playlist_items(playlist_id, valid_song_ids, duplicates=True)
+            await self._edit_playlist_call("add_playlist_items", self.authenticated_yt.add_playlist_items,
+                                           playlist_id, valid_song_ids, duplicates=True, retry_count=retry_count)
             return True
 
+        except PlaylistEditError as e:
+            # A rejected batch (e.g. an unavailable videoId) fails the same way every time;
+            # add_songs_bisect narrows it down instead of retrying
+            logger.warning(f"YouTube Music rejected {len(song_ids)} songs for playlist {playlist_id}: {e}")
+            return False
+
         except Exception as e:
-            if retry_count < self.max_retries:
-                logger.warning(f"Retrying adding songs to playlist {playlist_id} after error: {e}")
-                await asyncio.sleep(self.retry_delay * (retry_count + 1))
-                return await self.add_songs_to_playlist(playlist_id, song_ids, retry_count + 1)
-            
             logger.error(f"Failed to add songs to playlist {playlist_id}: {e}")
             return False
 
 
-    async def search_song(self, song_name: str, artists: List[str], retry_count: int = 0) -> Optional[str]:
-        """Search for a song with retry logic and similarity checking"""
-        logger.info(f"Searching for {song_name}")
-        if not song_name:
-            return None
+    async def _search_candidates(self, search_query: str, retry_count: int = 0) -> Optional[List[dict]]:
+        """Return candidate results for a query, from the search cache when possible"""
+        if self.search_cache:
+            cached = await self._run_blocking(self.search_cache.get, search_query)
+            if cached is not None:
+                return cached
 
-        search_query = f"{song_name} {' '.join(artists)}"
         try:
-            results = self.yt.search(search_query, filter="songs")
-            # return results
-            if not results:
-                return None
+            async with self.governor.limit("search"):
+                results = await self._run_blocking(self.yt.search, search_query, filter="songs")
+        except Exception as e:
+            if retry_count < self.max_retries:
+                logger.warning(f"Retrying search for {search_query} after error: {e}")
+                await self.governor.backoff("search", retry_count)
+                return await self._search_candidates(search_query, retry_count + 1)
 
-            # Check similarity of song name and artist
-            best_match = None
-            highest_similarity = 0
-            # logging.info(f"results are {results}")
-
-            for result in results[:3]:  # Check top 3 results
-                name_similarity = SequenceMatcher(None, song_name.lower(), 
-                                               result['title'].lower()).ratio()
-                
-                # Calculate artist similarity
-                artist_similarities = [
-                    SequenceMatcher(None, artist.lower(), 
-                                  result_artist['name'].lower()).ratio() 
-                    for artist in artists 
-                    for result_artist in result['artists']
-                ]
-                artist_similarity = max(artist_similarities) if artist_similarities else 0
-                
-                combined_similarity = (name_similarity + artist_similarity) / 2
-                if combined_similarity > highest_similarity:
-                    highest_similarity = combined_similarity
-                    best_match = result
-
-            if highest_similarity > 0.6:  # Threshold for accepting a match
-                return best_match["videoId"]
-            
+            logger.error(f"Failed to search for {search_query}: {e}")
             return None
 
+        results = SearchCache.slim_results(results or [])
+        if self.search_cache:
+            await self._run_blocking(self.search_cache.put, search_query, results)
+        return results
+
+    def score_candidates(self, song_name: str, artists: List[str], results: List[dict]) -> Tuple[Optional[dict], float]:
+        """Return the best of the top 3 candidates and its score under the scoring policy"""
+        return best_match(prepare_query(song_name, artists), results, self.scoring_policy)
+
+    async def add_songs_bisect(self, playlist_id: str, song_ids: List[str],
+                               retry_count: int = 0) -> Tuple[List[str], List[str], List[str]]:
+        """
+        Add songs and return (added, failed, refused) video IDs.
+
+        A failed batch is split in half and each half is retried without
+        further backoff, so one bad video ID only costs log2(n) extra calls.
+        `refused` are videos YouTube Music rejected on their own, which will
+        not succeed later either; `failed` still hit errors after retries.
+        The adaptive add-batch size shrinks once per call if any add hit an
+        error and grows otherwise; refused video IDs do not count against it.
+        """
+        if not self.authenticated_yt:
+            logger.error("YouTube Music not authenticated")
+            return [], list(song_ids), []
+
+        added, failed, refused, errored = await self._add_bisect(playlist_id, song_ids, retry_count)
+        if errored:
+            self.add_batch.record_failure()
+        else:
+            self.add_batch.record_success()
+        return added, failed, refused
+
+    async def _add_bisect(self, playlist_id: str, song_ids: List[str],
+                          retry_count: int) -> Tuple[List[str], List[str], List[str], bool]:
+        """add_songs_bisect's recursion; the flag tells whether any add failed with an error"""
+        try:
+            await self._edit_playlist_call("add_playlist_items", self.authenticated_yt.add_playlist_items,
+                                           playlist_id, song_ids, duplicates=True, retry_count=retry_count)
+            SONGS.inc(len(song_ids), stage="add", outcome="added")
+            return list(song_ids), [], [], False
+        except PlaylistEditError as e:
+            logger.warning(f"YouTube Music rejected {len(song_ids)} songs for playlist {playlist_id}: {e}")
+            errored = False
+        except Exception as e:
+            logger.error(f"Failed to add {len(song_ids)} songs to playlist {playlist_id}: {e}")
+            errored = True
+
+        if len(song_ids) <= 1:
+            if errored:
+                SONGS.inc(len(song_ids), stage="add", outcome="failed")
+                return [], list(song_ids), [], True
+            SONGS.inc(len(song_ids), stage="add", outcome="refused")
+            return [], [], list(song_ids), False
+
+        middle = len(song_ids) // 2
+        added, failed, refused, left_errored = await self._add_bisect(
+            playlist_id, song_ids[:middle], self.max_retries)
+        right_added, right_failed, right_refused, right_errored = await self._add_bisect(
+            playlist_id, song_ids[middle:], self.max_retries)
+        return (added + right_added, failed + right_failed, refused + right_refused,
+                errored or left_errored or right_errored)
+
+    async def get_playlist_items(self, playlist_id: str, retry_count: int = 0) -> Optional[List[dict]]:
+        """The playlist's current tracks as {videoId, setVideoId} dicts, or None on failure"""
+        try:
+            async with self.governor.limit("get_playlist"):
+                playlist = await self._run_blocking(self.authenticated_yt.get_playlist, playlist_id, limit=None)
         except Exception as e:
             if retry_count < self.max_retries:
-                logger.warning(f"Retrying search for {search_query} after error: {e}")
-                await asyncio.sleep(self.retry_delay * (retry_count + 1))
-                return await self.search_song(song_name, artists, retry_count + 1)
-            
-            logger.error(f"Failed to search for {search_query}: {e}")
+                logger.warning(f"Retrying reading playlist {playlist_id} after error: {e}")
+                await self.governor.backoff("get_playlist", retry_count)
+                return await self.get_playlist_items(playlist_id, retry_count + 1)
+
+            logger.error(f"Failed to read playlist {playlist_id}: {e}")
+            return None
+        return [{"videoId": track["videoId"], "setVideoId": track["setVideoId"]}
+                for track in playlist.get("tracks") or [] if track.get("videoId")]
+
+    async def sync_playlist(self, playlist_id: str, video_ids: List[str]) -> Optional[Dict[str, int]]:
+        """
+        Make a playlist hold exactly `video_ids`, in order, with as few calls as possible.
+
+        The live playlist is compared with the desired list: surplus items go
+        in one remove call, missing ones are appended in adaptive batches and
+        the order is then fixed with one move per item outside the longest
+        run that is already in order. Because it starts from the live state,
+        an interrupted sync converges on the next run. Videos YouTube Music
+        refuses are stored with Database.record_refused_songs and left out.
+        Returns counts of removed, added, refused and moved items, or None if
+        the playlist could not be read or a song, remove or move failed.
+        """
+        if not self.authenticated_yt:
+            logger.error("YouTube Music not authenticated")
+            return None
+
+        current = await self.get_playlist_items(playlist_id)
+        if current is None:
+            return None
+
+        targets = target_positions([item["videoId"] for item in current], video_ids)
+        surplus = [item for item, target in zip(current, targets) if target is None]
+        if surplus:
+            try:
+                await self._edit_playlist_call("remove_playlist_items", self.authenticated_yt.remove_playlist_items,
+                                               playlist_id, surplus)
+            except Exception as e:
+                logger.error(f"Failed to remove {len(surplus)} songs from playlist {playlist_id}: {e}")
+                return None
+
+        matched = {target for target in targets if target is not None}
+        missing = [video_id for position, video_id in enumerate(video_ids) if position not in matched]
+        added, failed, refused = [], [], []
+        start = 0
+        while start < len(missing):
+            batch = missing[start:start + self.add_batch.size]
+            start += len(batch)
+            batch_added, batch_failed, batch_refused = await self.add_songs_bisect(playlist_id, batch)
+            added += batch_added
+            failed += batch_failed
+            refused += batch_refused
+        if refused:
+            logger.warning(f"YouTube Music refused {len(refused)} songs for playlist {playlist_id}: {refused}")
+            await self.db.record_refused_songs(refused)
+        if failed:
+            logger.error(f"Failed to add {len(failed)} songs to playlist {playlist_id}: {failed}")
+
+        items = [item for item, target in zip(current, targets) if target is not None]
+        if added:
+            items = await self.get_playlist_items(playlist_id)
+            if items is None:
+                return None
+
+        # Songs that could not be added are left out of the desired order
+        skipped = Counter(failed + refused)
+        desired = []
+        for position, video_id in enumerate(video_ids):
+            if position not in matched and skipped[video_id]:
+                skipped[video_id] -= 1
+            else:
+                desired.append(video_id)
+        current_ids = [item["videoId"] for item in items]
+        if sorted(current_ids) != sorted(desired):
+            logger.warning(f"Playlist {playlist_id} changed during sync; leaving its order as is")
+            moves = []
+        else:
+            moves = plan_moves(current_ids, desired)
+
+        for item, successor in moves:
+            move = (items[item]["setVideoId"], items[successor]["setVideoId"]) if successor is not None \
+                else items[item]["setVideoId"]
+            try:
+                await self._edit_playlist_call("edit_playlist", self.authenticated_yt.edit_playlist,
+                                               playlist_id, moveItem=move)
+            except Exception as e:
+                logger.error(f"Failed to reorder playlist {playlist_id}: {e}")
+                return None
+
+        if failed:
+            # Counted as a failed sync so the next one adds them
+            return None
+        return {"removed": len(surplus), "added": len(added), "refused": len(refused), "moved": len(moves)}
+
+    async def search_isrc(self, isrc: str, song_name: str) -> Optional[str]:
+        """
+        Look a song up by ISRC and return the top result's videoId.
+
+        YouTube Music resolves an ISRC query to the recording it belongs to,
+        so no scoring is needed; the title check only rejects the occasional
+        unrelated result for an ISRC it does not know.
+        """
+        results = await self._search_candidates(isrc)
+        if not results:
+            return None
+        if similarity(normalize(song_name), normalize(results[0]["title"])) < self.isrc_title_guard:
             return None
+        return results[0]["videoId"]
+
+    async def search_song_scored(self, song_name: str, artists: List[str],
+                                 isrc: Optional[str] = None) -> Tuple[Optional[str], float]:
+        """
+        Search for a song and return the accepted videoId with its similarity.
+
+        Songs with an ISRC are looked up by it first (similarity 1.0); text
+        search and fuzzy scoring only run when that finds nothing.
+        """
+        logger.info(f"Searching for {song_name}")
+        if not song_name:
+            return None, 0
+
+        if isrc:
+            video_id = await self.search_isrc(isrc, song_name)
+            if video_id:
+                SONGS.inc(stage="search", outcome="isrc")
+                return video_id, 1.0
+
+        search_query = f"{song_name} {' '.join(artists)}"
+        results = await self._search_candidates(search_query)
+        if not results:
+            SONGS.inc(stage="search", outcome="not_found")
+            return None, 0
+
+        best_match, highest_similarity = self.score_candidates(song_name, artists, results)
+        if highest_similarity > self.similarity_threshold:  # Threshold for accepting a match
+            SONGS.inc(stage="search", outcome="matched")
+            return best_match["videoId"], highest_similarity
+
+        SONGS.inc(stage="search", outcome="rejected")
+        return None, highest_similarity
+
+    async def search_song(self, song_name: str, artists: List[str], isrc: Optional[str] = None) -> Optional[str]:
+        """Search for a song with retry logic and similarity checking"""
+        video_id, _ = await self.search_song_scored(song_name, artists, isrc)
+        return video_id
+
+    async def iter_search_songs(self, songs: List[Tuple]) -> AsyncIterator[Tuple[Tuple, Optional[str], float]]:
+        """
+        Yield (song, videoId, similarity) for each song, in input order.
+
+        Songs are (sp_song_id, name, artists) tuples with an optional ISRC as
+        a fourth element.
 
-    async def batch_search_songs(self, songs: List[Tuple]) -> Tuple[str, str, List]:
-        """Process songs in batches with rate limiting"""
+        Up to `search_concurrency` searches run ahead of the consumer. Songs
+        known to the global match store are yielded without searching, and
+        new matches are written back to it as they are found.
+        """
+        if not songs:
+            return
+
+        known = {}
+        if self.match_store:
+            known = await self._run_blocking(self.match_store.get_many, [song[0] for song in songs])
+            if known:
+                logger.info(f"Reusing {len(known)} matches from the global match store")
+
+        to_search = sum(1 for song in songs if song[0] not in known)
+        completed = 0
+        new_matches = []
+        pending = deque()
+        remaining = iter(songs)
+
+        def schedule() -> None:
+            while len(pending) < self.search_concurrency:
+                song = next(remaining, None)
+                if song is None:
+                    return
+                if song[0] in known:
+                    pending.append((song, None))
+                else:
+                    isrc = song[3] if len(song) > 3 else None
+                    pending.append((song, asyncio.ensure_future(self.search_song_scored(song[1], song[2], isrc))))
+
+        try:
+            schedule()
+            while pending:
+                song, task = pending.popleft()
+                if task is None:
+                    video_id, confidence = known[song[0]]
+                else:
+                    video_id, confidence = await task
+                    completed += 1
+                    if video_id:
+                        new_matches.append((song[0], video_id, confidence))
+                    if completed % self.batch_size == 0 or completed == to_search:
+                        logger.info(f"Searched {completed}/{to_search} songs "
+                                    f"({self.governor.current_rate('search'):.2f} searches/s)")
+                schedule()
+                yield song, video_id, confidence
+        finally:
+            for _, task in pending:
+                if task:
+                    task.cancel()
+            if self.match_store and new_matches:
+                await self._run_blocking(self.match_store.put_many, new_matches)
+
+    async def batch_search_songs(self, songs: List[Tuple]) -> Tuple[List, List, List]:
+        """Search for songs concurrently, keeping results in input order"""
         yt_songs = []
         yt_spot_mappings = []
         failed_songs = []
 
-        for i in range(0, len(songs), self.batch_size):
-            batch = songs[i:i + self.batch_size]
-            logger.info(f"Processing batch {i//self.batch_size + 1}/{len(songs)//self.batch_size + 1}")
-            
-            for song in batch:
-                result = await self.search_song(song[1], song[2])
-                
-                if result:
-                    yt_songs.append((result, song[1]))
-                    yt_spot_mappings.append((song[0], result))
-                else:
-                    failed_songs.append(song)
-                
-                await asyncio.sleep(0.5)  # Rate limiting
-            
-            if i + self.batch_size < len(songs):
-                await asyncio.sleep(2)  # Batch delay
+        async for song, result, _ in self.iter_search_songs(songs):
+            if result:
+                yt_songs.append((result, song[1]))
+                yt_spot_mappings.append((song[0], result))
+            else:
+                failed_songs.append(song)
+
+        return yt_songs, yt_spot_mappings, failed_songs
+
+
+class SearchPlan:
+    """
+    Searches a set of songs once each and shares the results.
+
+    The songs, (sp_song_id, name, artists[, isrc]) tuples, are searched in
+    order in the background. Any number of playlists can await a song's
+    result, so a song that appears in many playlists costs one search.
+    Matches are saved to the database as they are found.
+    """
+
+    def __init__(self, manager: YouTubeManager, songs: List[Tuple]) -> None:
+        self.manager = manager
+        self.songs = songs
+        self.results: Dict[str, asyncio.Future] = {}
+        self.task = None
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self.results = {song[0]: loop.create_future() for song in self.songs}
+        self.task = asyncio.ensure_future(self._run())
+
+    async def _write_matches(self, matches: List[Tuple[str, str, str]]) -> None:
+        await self.manager.db.insert_youtube_songs([(video_id, name) for _, video_id, name in matches])
+        await self.manager.db.insert_youtube_spotify_songs([(sp_id, video_id) for sp_id, video_id, _ in matches])
+
+    async def _persist(self, matches: List[Tuple[str, str, str]]) -> None:
+        """Write matches; a close cannot stop this between the song and mapping writes"""
+        write = asyncio.ensure_future(self._write_matches(matches))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            await write
+            raise
+
+    async def _run(self) -> None:
+        matches = []
+        try:
+            async for song, video_id, _ in self.manager.iter_search_songs(self.songs):
+                if video_id:
+                    matches.append((song[0], video_id, song[1]))
+                self.results[song[0]].set_result(video_id)
+                if len(matches) >= self.manager.batch_size:
+                    batch, matches = matches, []
+                    await self._persist(batch)
+        except Exception as e:
+            logger.error(f"Search plan failed: {e}")
+            for future in self.results.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            if matches:
+                await self._persist(matches)
+
+    async def result(self, sp_song_id: str) -> Optional[str]:
+        """The song's videoId, or None if it was not matched or is not part of the plan"""
+        future = self.results.get(sp_song_id)
+        if future is None:
+            return None
+        # One playlist being cancelled must not cancel the shared result
+        return await asyncio.shield(future)
 
-        return yt_songs, yt_spot_mappings, failed_songs
\ No newline at end of file
+    async def close(self) -> None:
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        for future in self.results.values():
+            if not future.done():
+                future.cancel()
+            elif not future.cancelled():
+                future.exception()  # mark failures as retrieved